@@ -0,0 +1,127 @@
+import multiprocessing
+import os
+import pickle
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from engine import PHASE_PLACING, PHASE_MOVING
+
+
+# Expected troop balance of a player: sum of the expected Z measurement observables of the
+# qubits of its countries minus the ones of its opponent (exact, read from the state)
+def evaluate(state, player):
+    bloch = state.circuit.bloch_vectors()
+    score = 0.0
+    for country in state.world.get_all_countries():
+        strength = -float(bloch[country.qubits, 2].sum())
+        score += strength if country.is_owned(player) else -strength
+    return score
+
+
+# Play the game randomly from the given state for the given amount of turns
+def random_playout(state, turns, rng):
+    last_turn = state.turn + turns
+    while state.turn < last_turn:
+        if state.phase == PHASE_PLACING:
+            placements = state.legal_placements()
+            if len(placements) > 0:
+                state.place(rng.choice(placements))
+            else:
+                state.end_phase()           # e.g. the player owns no country anymore
+        elif state.phase == PHASE_MOVING:
+            swaps = state.legal_swaps() if rng.random() < 0.5 else []
+            if len(swaps) > 0:
+                state.swap(*rng.choice(swaps))
+            else:
+                state.end_phase()
+
+
+def play_candidate(state, candidate):
+    if state.phase == PHASE_PLACING:
+        state.place(candidate)
+    elif candidate is None:
+        state.end_phase()
+    else:
+        state.swap(*candidate)
+
+
+# Worker process: run rollouts of every candidate in turn until the deadline.
+# Each rollout starts from a fresh copy of the state and circuit.
+def rollout_worker(state_blob, candidates, player, deadline, turns, seed):
+    rng = random.Random(seed)
+    totals = [0.0] * len(candidates)
+    counts = [0] * len(candidates)
+    index = 0
+    while True:
+        state = pickle.loads(state_blob)
+        play_candidate(state, candidates[index])
+        random_playout(state, turns, rng)
+        totals[index] += evaluate(state, player)
+        counts[index] += 1
+        index = (index + 1) % len(candidates)
+        if time.monotonic() >= deadline:
+            return totals, counts
+
+
+# Computer player choosing its moves by Monte Carlo rollouts of the game.
+# Rollouts are spread over a process pool, so decision quality scales with the core count.
+class MonteCarloPlayer:
+    def __init__(self, player, time_budget=1.0, workers=None, rollout_turns=2, seed=None):
+        self.player = player
+        self.time_budget = time_budget          # Seconds spent on each decision
+        self.workers = workers or os.cpu_count() or 1
+        self.rollout_turns = rollout_turns      # Turns played randomly after each candidate
+        self.rng = random.Random(seed)
+        self.pool = None
+        self.thinker = ThreadPoolExecutor(max_workers=1)
+
+    def get_pool(self):
+        if self.pool is None:
+            # Spawned, not forked: the pool is started from the thinker thread of a threaded Tk process
+            self.pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+        return self.pool
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown(cancel_futures=True)
+            self.pool = None
+        self.thinker.shutdown(wait=False)
+
+    def get_candidates(self, state):
+        if state.phase == PHASE_PLACING:
+            moves = {}
+            for move in state.legal_placements():
+                moves.setdefault((move.gate, move.country1, move.country2), move)
+            return list(moves.values())
+        return [None] + state.legal_swaps()
+
+    # The best candidate for the current phase: a PlacingMove while placing troops,
+    # a (country1, country2) pair or None (no swap) while moving them
+    def choose(self, state):
+        return self.search(pickle.dumps(state), self.get_candidates(state))
+
+    # Same as choose, computed in the background so the UI thread stays responsive.
+    # The state is copied right away, it can be modified while the search runs.
+    def choose_async(self, state):
+        return self.thinker.submit(self.search, pickle.dumps(state), self.get_candidates(state))
+
+    def search(self, blob, candidates):
+        if len(candidates) <= 1:
+            return candidates[0] if len(candidates) > 0 else None
+
+        candidates = list(candidates)
+        self.rng.shuffle(candidates)    # Unexplored candidates are random if the budget is short
+        deadline = time.monotonic() + self.time_budget
+        chunks = [candidates[i::self.workers] for i in range(self.workers)]
+        futures = [(chunk, self.get_pool().submit(rollout_worker, blob, chunk, self.player, deadline,
+                                                  self.rollout_turns, self.rng.getrandbits(32)))
+                   for chunk in chunks if len(chunk) > 0]
+
+        best, best_score = candidates[0], float("-inf")
+        for chunk, future in futures:
+            totals, counts = future.result()
+            for candidate, total, count in zip(chunk, totals, counts):
+                if count > 0 and total / count > best_score:
+                    best, best_score = candidate, total / count
+        return best
@@ -0,0 +1,43 @@
+import hashlib
+import os
+from tkinter import PhotoImage
+
+CACHE_DIRECTORY = ".cache"
+
+
+# Path of the cached copy of an image scaled to fit in (width, height).
+# The key is the hash of the source file, so editing the image invalidates its cache.
+def get_cache_path(source, width, height):
+	with open(source, "rb") as f:
+		digest = hashlib.sha256(f.read()).hexdigest()[:16]
+	directory = os.path.join(os.path.dirname(os.path.abspath(source)), CACHE_DIRECTORY)
+	name = os.path.splitext(os.path.basename(source))[0]
+	return os.path.join(directory, f"{name}-{digest}-{width}x{height}.png")
+
+
+# Scale the image with a LANCZOS thumbnail and store it uncompressed in the cache
+def scale_image(source, width, height, target):
+	from PIL import Image
+	image = Image.open(source)
+	image.thumbnail((width, height), Image.Resampling.LANCZOS)
+	os.makedirs(os.path.dirname(target), exist_ok=True)
+	temporary = f"{target}.{os.getpid()}.tmp"
+	image.save(temporary, format="PNG", compress_level=0)
+	os.replace(temporary, target)
+
+
+# PhotoImage of the source image scaled to fit in (width, height).
+# Only the first run decodes and resizes the image, later runs give the cached
+# pixels straight to Tk, without going through PIL.
+def load_scaled_image(source, width, height):
+	target = get_cache_path(source, width, height)
+	if not os.path.exists(target):
+		try:
+			scale_image(source, width, height, target)
+		except OSError:		# Read-only location: scale without caching
+			from PIL import Image, ImageTk
+			image = Image.open(source)
+			image.thumbnail((width, height), Image.Resampling.LANCZOS)
+			return ImageTk.PhotoImage(image)
+	with open(target, "rb") as f:
+		return PhotoImage(data=f.read(), format="png")
@@ -0,0 +1,378 @@
+import argparse
+import time
+import numpy as np
+
+from quantum import BASIS_GATES, DOUBLE_GATES, SINGLE_GATES
+from simulator import SEPARABILITY_TOLERANCE
+
+# Largest entangled block a batch can hold, a block of k qubits takes 16 * 2^k bytes per game
+DEFAULT_MAX_BLOCK = 14
+
+GATES = list(SINGLE_GATES) + list(DOUBLE_GATES)
+
+
+# Every block of k qubits of a batch, stored as the rows of one (capacity, 2^k) array.
+# Freed rows are reused by the next allocations, the array only grows.
+class BlockPool:
+    def __init__(self, k, capacity=0):
+        self.k = k
+        self.amplitudes = np.zeros((capacity, 2 ** k), dtype=complex)
+        self.free = np.arange(capacity, dtype=np.int64)
+
+    def allocate(self, count):
+        if count > len(self.free):
+            capacity = len(self.amplitudes)
+            grow = max(capacity, count - len(self.free))
+            self.amplitudes = np.concatenate([self.amplitudes, np.zeros((grow, 2 ** self.k), dtype=complex)])
+            self.free = np.concatenate([self.free, np.arange(capacity, capacity + grow)])
+        slots = self.free[len(self.free) - count:]
+        self.free = self.free[:len(self.free) - count]
+        return slots
+
+    def release(self, slots):
+        self.free = np.concatenate([self.free, slots])
+
+
+# Block simulator (see simulator.StateSimulator) running many independent circuits of the
+# same size at once. The block of every (game, qubit) is given by three arrays: its size k,
+# its row in the pool of k-qubit blocks and the axis of the qubit in it (axis 0 being the
+# most significant bit of the row index). A gate is applied to one target per game in a
+# single vectorized operation per block size, whatever the amount of games.
+# Like the single game simulator, the qubits no longer entangled after a measurement leave
+# their block. A game whose block would go over max_block qubits is retired instead of
+# failing the batch: its state stays valid but it ignores every later double gate, see retired.
+class BatchSimulator:
+    def __init__(self, games, qubits, seed=None, max_block=DEFAULT_MAX_BLOCK):
+        self.games = games
+        self.size = qubits
+        self.rng = np.random.default_rng(seed)
+        self.max_block = max_block
+        self.pools = {1: BlockPool(1, games * qubits)}
+        self.pools[1].amplitudes[:, 0] = 1.0
+        self.pools[1].free = self.pools[1].free[:0]
+        self.block_size = np.ones((games, qubits), dtype=np.int64)
+        self.block_slot = np.arange(games * qubits, dtype=np.int64).reshape(games, qubits)
+        self.axis = np.zeros((games, qubits), dtype=np.int64)
+        self.retired = np.zeros(games, dtype=bool)
+
+    def pool(self, k):
+        if k > self.max_block:
+            raise ValueError(f"Entangled block of {k} qubits, the batch is limited to {self.max_block}")
+        if k not in self.pools:
+            self.pools[k] = BlockPool(k)
+        return self.pools[k]
+
+    def largest_block_size(self):
+        return int(self.block_size.max(initial=0))
+
+    # Row indices of the amplitudes touched by a gate on the given bits of k-qubit blocks:
+    # shape (m, 2^j, 2^(k-j)), the second axis enumerates the values of the j bits with the
+    # first one as the most significant, like the gate matrices
+    @staticmethod
+    def _indices(k, bits):
+        m, j = bits.shape
+        rows = np.arange(2 ** k)
+        zero = ((rows[None, None, :] >> bits[:, :, None]) & 1).sum(axis=1) == 0
+        base = np.nonzero(zero)[1].reshape(m, -1)
+        values = (np.arange(2 ** j)[:, None] >> np.arange(j - 1, -1, -1)[None, :]) & 1
+        offsets = values @ (1 << bits).T
+        return base[:, None, :] + offsets.T[:, :, None]
+
+    # Apply the matrix (or one matrix per game) on the qubits of each game, which must all
+    # be in the same block of their game
+    def _apply(self, matrix, games, qubits):
+        sizes = self.block_size[games, qubits[:, 0]]
+        for k in np.unique(sizes).tolist():
+            selected = sizes == k
+            g, q = games[selected], qubits[selected]
+            slots = self.block_slot[g, q[:, 0]][:, None, None]
+            indices = self._indices(k, k - 1 - self.axis[g[:, None], q])
+            amplitudes = self.pools[k].amplitudes
+            amplitudes[slots, indices] = (matrix if matrix.ndim == 2 else matrix[selected]) @ amplitudes[slots, indices]
+
+    # Merge the blocks of qubits1 and qubits2 of each game, which must be different blocks.
+    # The axes of the second block follow the ones of the first.
+    def _merge(self, games, qubits1, qubits2):
+        sizes1, sizes2 = self.block_size[games, qubits1], self.block_size[games, qubits2]
+        for k1, k2 in set(zip(sizes1.tolist(), sizes2.tolist())):
+            selected = (sizes1 == k1) & (sizes2 == k2)
+            g = games[selected]
+            slots1, slots2 = self.block_slot[g, qubits1[selected]], self.block_slot[g, qubits2[selected]]
+            pool = self.pool(k1 + k2)
+            slots = pool.allocate(len(g))
+            pool.amplitudes[slots] = (self.pools[k1].amplitudes[slots1][:, :, None] *
+                                      self.pools[k2].amplitudes[slots2][:, None, :]).reshape(len(g), -1)
+
+            in1 = np.nonzero((self.block_size[g] == k1) & (self.block_slot[g] == slots1[:, None]))
+            in2 = np.nonzero((self.block_size[g] == k2) & (self.block_slot[g] == slots2[:, None]))
+            for (rows, columns), shift in ((in1, 0), (in2, k1)):
+                self.block_size[g[rows], columns] = k1 + k2
+                self.block_slot[g[rows], columns] = slots[rows]
+                self.axis[g[rows], columns] += shift
+            self.pools[k1].release(slots1)
+            self.pools[k2].release(slots2)
+
+    # Move qubits[i] of games[i], in blocks of k qubits at the given slots and axes, to a block of
+    # its own with the single amplitudes, the other qubits keep the rest amplitudes in a block
+    # of k - 1 qubits. Returns the (game row, qubit) of the qubits of the k - 1 blocks.
+    def _detach(self, games, qubits, k, slots, axes, single, rest):
+        pool = self.pool(k - 1)
+        rest_slots = pool.allocate(len(games))
+        pool.amplitudes[rest_slots] = rest
+        rows, columns = np.nonzero((self.block_size[games] == k) & (self.block_slot[games] == slots[:, None]))
+        self.block_size[games[rows], columns] = k - 1
+        self.block_slot[games[rows], columns] = rest_slots[rows]
+        self.axis[games[rows], columns] -= self.axis[games[rows], columns] > axes[rows]
+
+        ones = self.pools[1].allocate(len(games))
+        self.pools[1].amplitudes[ones] = single
+        self.block_size[games, qubits], self.block_slot[games, qubits], self.axis[games, qubits] = 1, ones, 0
+        self.pools[k].release(slots)
+        others = columns != qubits[rows]
+        return rows[others], columns[others]
+
+    # Factor out qubits[i] of games[i] when it is no longer entangled with its block (see
+    # simulator.StateSimulator._split). The qubits of a game are checked one after the other.
+    def _split(self, games, qubits):
+        for qubit in np.unique(qubits).tolist():
+            g = games[qubits == qubit]
+            sizes = self.block_size[g, qubit]
+            for k in np.unique(sizes[sizes > 1]).tolist():
+                selected = g[sizes == k]
+                slots, axes = self.block_slot[selected, qubit], self.axis[selected, qubit]
+                values = self.pools[k].amplitudes[slots[:, None, None], self._indices(k, (k - 1 - axes)[:, None])]
+                rho = values @ values.conj().transpose(0, 2, 1)
+                separable = np.abs(np.linalg.det(rho)) <= SEPARABILITY_TOLERANCE
+                if not separable.any():
+                    continue
+
+                # Pure reduced state: the qubit is in the dominant eigenvector of rho
+                _, vectors = np.linalg.eigh(rho[separable])
+                single = vectors[:, :, 1]
+                rest = np.einsum("mi,mij->mj", single.conj(), values[separable])
+                rest /= np.linalg.norm(rest, axis=1, keepdims=True)
+                self._detach(selected[separable], np.full(np.count_nonzero(separable), qubit), k,
+                             slots[separable], axes[separable], single, rest)
+
+    # Apply a gate of quantum.SINGLE_GATES (or a 2x2 unitary) on qubits[i] of games[i]
+    def apply_single_gate(self, gate, games, qubits):
+        matrix = SINGLE_GATES[gate] if isinstance(gate, str) else np.asarray(gate)
+        self._apply(matrix, np.asarray(games), np.asarray(qubits)[:, None])
+
+    # Apply a gate of quantum.DOUBLE_GATES (or a 4x4 unitary, control first) in every game
+    def apply_double_gate(self, gate, games, controls, targets):
+        matrix = DOUBLE_GATES[gate] if isinstance(gate, str) else np.asarray(gate)
+        games, controls, targets = np.asarray(games), np.asarray(controls), np.asarray(targets)
+        if np.any(controls == targets):
+            raise ValueError("The control and the target of a gate must be different qubits")
+        apart = (self.block_size[games, controls] != self.block_size[games, targets]) | \
+                (self.block_slot[games, controls] != self.block_slot[games, targets])
+        overflow = apart & (self.block_size[games, controls] + self.block_size[games, targets] > self.max_block)
+        self.retired[games[overflow]] = True
+        playing = ~self.retired[games]
+        games, controls, targets, apart = games[playing], controls[playing], targets[playing], apart[playing]
+        if np.any(apart):
+            self._merge(games[apart], controls[apart], targets[apart])
+        self._apply(matrix, games, np.stack([controls, targets], axis=1))
+
+    # A swap only exchanges the labels of the two qubits, as in the single game simulator
+    def swap(self, games, qubits1, qubits2):
+        games, qubits1, qubits2 = np.asarray(games), np.asarray(qubits1), np.asarray(qubits2)
+        for array in (self.block_size, self.block_slot, self.axis):
+            array[games, qubits1], array[games, qubits2] = array[games, qubits2], array[games, qubits1]
+
+    # Measure qubits[i] of games[i] in the given basis, with one random draw for the batch.
+    # The measured qubits leave their blocks, and so do the qubits of these blocks that are no
+    # longer entangled. Returns the +1/-1 outcomes.
+    def measure(self, games, qubits, basis="Z"):
+        games, qubits = np.asarray(games), np.asarray(qubits)
+        if basis not in ("X", "Y", "Z"):
+            raise ValueError("Basis must be 'X', 'Y', or 'Z'")
+        if basis != "Z":
+            self._apply(BASIS_GATES[f"TO_Z_{basis}"], games, qubits[:, None])
+
+        draws = self.rng.random(len(games))
+        results = np.empty(len(games), dtype=np.int64)
+        sizes = self.block_size[games, qubits]
+        for k in np.unique(sizes).tolist():
+            selected = sizes == k
+            g, q = games[selected], qubits[selected]
+            slots, axes = self.block_slot[g, q], self.axis[g, q]
+            indices = self._indices(k, (k - 1 - axes)[:, None])
+            values = self.pools[k].amplitudes[slots[:, None, None], indices]
+            weights = np.sum(np.abs(values) ** 2, axis=2)
+            bits = (draws[selected] * weights.sum(axis=1) < weights[:, 1]).astype(np.int64)
+            results[selected] = bits
+            if k == 1:
+                self.pools[1].amplitudes[slots] = np.eye(2, dtype=complex)[bits]
+                continue
+
+            # The other qubits keep the amplitudes of the outcome, in a block of k - 1 qubits
+            rows = np.arange(len(g))
+            rest = values[rows, bits] / np.sqrt(weights[rows, bits])[:, None]
+            rows, columns = self._detach(g, q, k, slots, axes, np.eye(2, dtype=complex)[bits], rest)
+            if k > 2:
+                self._split(g[rows], columns)
+
+        if basis != "Z":
+            self._apply(BASIS_GATES[f"FROM_Z_{basis}"], games, qubits[:, None])
+        return results * 2 - 1
+
+    # Expected Z observable of every qubit of every game, as an array of shape (games, size)
+    def z_expectations(self):
+        result = np.empty((self.games, self.size))
+        for k in np.unique(self.block_size).tolist():
+            g, q = np.nonzero(self.block_size == k)
+            indices = self._indices(k, (k - 1 - self.axis[g, q])[:, None])
+            weights = np.sum(np.abs(self.pools[k].amplitudes[self.block_slot[g, q][:, None, None], indices]) ** 2, axis=2)
+            result[g, q] = weights[:, 0] - weights[:, 1]
+        return result
+
+
+# Random index of a True entry of each row of mask (-1 for the rows without any)
+def random_choice(rng, mask):
+    keys = np.where(mask, rng.random(mask.shape), -1.0)
+    choice = np.argmax(keys, axis=1)
+    return np.where(mask.any(axis=1), choice, -1)
+
+
+# Many games on the same map played at once by random players, for balancing runs.
+# The games advance in lockstep (both players place every move, then swap or not), so each
+# step is a few vectorized operations on the whole batch instead of one call per game.
+# Like the rollouts of ai.py, moves use the first qubit of each country, and swaps are
+# played between neighbouring countries.
+class BatchGames:
+    def __init__(self, world, games, seed=None, max_block=DEFAULT_MAX_BLOCK):
+        countries = world.get_all_countries()
+        continents = list(world.continents)
+        index = {country.name: i for i, country in enumerate(countries)}
+        self.games = games
+        self.rng = np.random.default_rng(seed)
+        self.simulator = BatchSimulator(games, world.get_qubit_amount(), self.rng.integers(2 ** 32), max_block)
+        self.turn = 1
+        self.first_qubit = np.array([country.qubits[0] for country in countries])
+        self.qubit_country = np.array([index[country.name] for country in countries for _ in country.qubits])
+        self.edges = np.array([(index[a], index[b]) for a, b in world.country_graph.edges()]).reshape(-1, 2)
+
+        # Gates given by the owned countries and the continental bonuses, as one-hot matrices
+        self.continent = np.zeros((len(countries), len(continents)), dtype=np.int64)
+        self.continent[np.arange(len(countries)), [continents.index(c.continent) for c in countries]] = 1
+        self.continent_sizes = self.continent.sum(axis=0)
+        self.country_gates = self.continent @ self.gate_matrix([world.continents[c].gate for c in continents])
+        # Continents of a single country give no bonus
+        self.bonus_gates = self.gate_matrix([f"C{world.continents[c].gate}" if size >= 2 else None
+                                             for c, size in zip(continents, self.continent_sizes.tolist())])
+        self.owners = self.balanced_owners(len(countries))
+
+    # One-hot rows of the gates, None gives an empty row
+    @staticmethod
+    def gate_matrix(gates):
+        matrix = np.zeros((len(gates), len(GATES)), dtype=np.int64)
+        for row, gate in enumerate(gates):
+            if gate is not None:
+                matrix[row, GATES.index(gate)] = 1
+        return matrix
+
+    # Same split as World.initialize_balanced_ownership, drawn for every game at once
+    def balanced_owners(self, countries):
+        half = countries // 2
+        eligible = np.nonzero((self.continent_sizes >= 2) & (self.continent_sizes <= half))[0]
+        keys = self.rng.random((self.games, countries))
+        if len(eligible) > 0:
+            chosen = eligible[self.rng.integers(len(eligible), size=self.games)]
+            keys[self.continent[:, chosen].T == 1] = -1.0       # The continent comes first
+        owners = np.full((self.games, countries), 2, dtype=np.int8)
+        np.put_along_axis(owners, np.argsort(keys, axis=1)[:, :half], 1, axis=1)
+        return owners
+
+    # Gates of each game for the player, as counts of shape (games, len(GATES))
+    def placing_moves(self, player):
+        own = (self.owners == player).astype(np.int64)
+        bonus = ((own @ self.continent) == self.continent_sizes) & (self.continent_sizes >= 2)
+        return own @ self.country_gates + bonus.astype(np.int64) @ self.bonus_gates
+
+    # Place every move of the player in a random order, on random countries
+    def place_moves(self, player):
+        remaining = self.placing_moves(player)
+        own, enemy = self.owners == player, self.owners != player
+        while remaining.any():
+            active = np.nonzero(remaining.sum(axis=1) > 0)[0]
+            counts = remaining[active]
+            draws = self.rng.random(len(active)) * counts.sum(axis=1)
+            gates = (np.cumsum(counts, axis=1) <= draws[:, None]).sum(axis=1)
+            remaining[active, gates] -= 1
+            country1 = random_choice(self.rng, own[active])
+            country2 = random_choice(self.rng, enemy[active])
+            for gate in np.unique(gates).tolist():
+                selected = gates == gate
+                games = active[selected]
+                if GATES[gate] in SINGLE_GATES:
+                    self.simulator.apply_single_gate(GATES[gate], games, self.first_qubit[country1[selected]])
+                else:
+                    self.simulator.apply_double_gate(GATES[gate], games, self.first_qubit[country2[selected]],
+                                                     self.first_qubit[country1[selected]])
+
+    # Half of the games swap the troops of two random neighbouring countries of the player
+    def move_troops(self, player):
+        own = self.owners == player
+        edges = random_choice(self.rng, own[:, self.edges[:, 0]] & own[:, self.edges[:, 1]])
+        games = np.nonzero((edges >= 0) & (self.rng.random(self.games) < 0.5))[0]
+        if len(games) > 0:
+            countries = self.edges[edges[games]]
+            self.simulator.swap(games, self.first_qubit[countries[:, 0]], self.first_qubit[countries[:, 1]])
+
+    def play_turn(self):
+        player = 2 - self.turn % 2
+        self.place_moves(player)
+        self.move_troops(player)
+        self.turn += 1
+
+    # Expected troop strength of each country of each game, as in GameInstance
+    def troop_strength(self):
+        strength = np.zeros(self.owners.shape)
+        np.add.at(strength.T, self.qubit_country, -self.simulator.z_expectations().T)
+        return strength / np.bincount(self.qubit_country)
+
+    # Measure every qubit of every game in the Z basis: a player scores the +1/-1 outcomes of
+    # the qubits of its countries. Returns the winner of each game, 0 for a draw and -1 for the
+    # games retired by the simulator (their entanglement went over max_block).
+    def final_battle(self):
+        games = np.arange(self.games)
+        outcomes = np.stack([self.simulator.measure(games, np.full(self.games, qubit))
+                             for qubit in range(self.simulator.size)], axis=1)
+        owners = self.owners[:, self.qubit_country]
+        score = np.where(owners == 1, outcomes, -outcomes).sum(axis=1)
+        winners = np.where(score > 0, 1, np.where(score < 0, 2, 0))
+        return np.where(self.simulator.retired, -1, winners)
+
+
+def play_batch(world, games, turns, seed=None, max_block=DEFAULT_MAX_BLOCK):
+    batch = BatchGames(world, games, seed, max_block)
+    for _ in range(turns):
+        batch.play_turn()
+    return batch.final_battle()
+
+
+if __name__ == "__main__":
+    from graph import load_world
+
+    parser = argparse.ArgumentParser(description="Play many random games at once for balancing runs")
+    parser.add_argument("--map", default="risk_graph.txt")
+    parser.add_argument("--games", type=int, nargs="+", default=[1, 10, 100, 1000])
+    parser.add_argument("--turns", type=int, default=8, help="player turns before the final battle")
+    parser.add_argument("--max-block", type=int, default=DEFAULT_MAX_BLOCK)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    world = load_world(args.map)
+    print(f"{'games':>8}{'games/s':>12}{'wins 1':>9}{'wins 2':>9}{'draws':>9}{'retired':>9}")
+    for games in args.games:
+        start = time.perf_counter()
+        winners = play_batch(world, games, args.turns, args.seed, args.max_block)
+        elapsed = time.perf_counter() - start
+        retired = np.count_nonzero(winners < 0)
+        wins = np.bincount(winners[winners >= 0], minlength=3) / max(1, games - retired)
+        print(f"{games:>8}{games / elapsed:>12.1f}{wins[1]:>9.1%}{wins[2]:>9.1%}{wins[0]:>9.1%}{retired / games:>9.1%}")
+        if retired > 0:
+            print(f"[WARNING] {retired} games went over {args.max_block} entangled qubits and are left out of the "
+                  f"win rates, raise --max-block or lower --turns")
@@ -0,0 +1,98 @@
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+
+from graph import load_world
+from mapgen import generate_map
+
+
+# Time a function: returns the average seconds per call over the given amount of calls
+def measure(function, calls=1):
+	start = time.perf_counter()
+	for _ in range(calls):
+		function()
+	return (time.perf_counter() - start) / calls
+
+
+def bench_render(world):
+	try:
+		from view import WorldView
+		view = WorldView(world)
+	except Exception as error:		# No display available
+		return f"skipped ({type(error).__name__})"
+	view.root.withdraw()
+	try:
+		first = measure(view.render)
+		names = [country.name for country in world.get_all_countries()]
+		view.troop_strength = {name: random.random() for name in names[:10]}
+		changed = measure(view.render)
+		return {"first": first, "ten_changed": changed, "unchanged": measure(view.render, 10)}
+	finally:
+		view.root.destroy()
+
+
+# Countries of the player with an enemy neighbour, by a loop over the graph (baseline of World.get_frontier)
+def frontier_loop(world, player):
+	frontier = []
+	for country in world.get_all_possessions(player):
+		for neighbour in world.country_graph.neighbors(country.name):
+			if world.get_country(neighbour).owner not in (player, 0):
+				frontier.append(country.name)
+				break
+	return frontier
+
+
+# Benchmark the World operations on a generated map of the given size
+def bench_size(directory, countries, continents, queries, render):
+	filename = os.path.join(directory, f"map_{countries}.txt")
+	result = {"countries": countries, "generate": measure(lambda: generate_map(filename, countries, continents, seed=0))}
+	result["load_cold"] = measure(lambda: load_world(filename))
+	world = load_world(filename)
+	result["load_warm"] = measure(lambda: load_world(filename), 3)
+	result["balanced_ownership"] = measure(world.initialize_balanced_ownership)
+
+	names = [country.name for country in world.get_all_countries()]
+	rng = random.Random(0)
+	pairs = [(rng.choice(names), rng.choice(names)) for _ in range(queries)]
+	result["are_connected"] = measure(lambda: [world.are_connected(a, b) for a, b in pairs]) / queries
+	result["get_all_continental_bonus"] = measure(lambda: world.get_all_continental_bonus(1), queries)
+	result["get_all_possessions"] = measure(lambda: world.get_all_possessions(1), 10)
+	result["set_owner"] = measure(lambda: [world.set_owner(rng.choice(names), rng.choice((1, 2))) for _ in range(queries)]) / queries
+	world.arrays.vectorize()
+	calls = max(1, queries // 100)
+	result["frontier_graph_loop"] = measure(lambda: frontier_loop(world, 1), calls)
+	result["frontier_arrays"] = measure(lambda: world.arrays.frontier(1), calls)
+	result["attack_pairs_arrays"] = measure(lambda: world.arrays.attack_pairs(1), calls)
+	result["border_lengths_arrays"] = measure(world.arrays.border_lengths, calls)
+	if render:
+		result["render"] = bench_render(world)
+	return result
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="Benchmark the World operations against the map size")
+	parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000, 100000])
+	parser.add_argument("--continents", type=int, default=20)
+	parser.add_argument("--queries", type=int, default=1000)
+	parser.add_argument("--render", action="store_true", help="also time the rendering (needs a display)")
+	parser.add_argument("--json", help="write the results to this file")
+	args = parser.parse_args()
+
+	results = []
+	with tempfile.TemporaryDirectory() as directory:
+		for size in args.sizes:
+			result = bench_size(directory, size, min(args.continents, size), args.queries, args.render)
+			results.append(result)
+			print(f"{size} countries:")
+			for key, value in result.items():
+				if isinstance(value, float):
+					print(f"  {key:<28}{value * 1e6:14.1f} us")
+				elif key != "countries":
+					print(f"  {key:<28}{value}")
+
+	if args.json is not None:
+		with open(args.json, "w") as f:
+			json.dump(results, f, indent=2)
@@ -0,0 +1,69 @@
+from collections import deque
+
+# Default limits of a CheckpointBuffer
+CHECKPOINT_CAPACITY = 256
+CHECKPOINT_BUDGET = 64 * 2 ** 20      # Bytes of quantum state kept alive by the checkpoints
+
+
+# Copy of a GameState at a phase boundary.
+# The simulator blocks are never modified once created, so a checkpoint only keeps references
+# to the current blocks: consecutive checkpoints share every block which did not change.
+class Checkpoint:
+    def __init__(self, state):
+        self.turn = state.turn
+        self.phase = state.phase
+        self.current_player = state.current_player
+        self.actions = state.actions
+        self.moves = tuple(move.gate for move in state.current_moves)
+        self.owners = tuple(country.owner for country in state.world.get_all_countries())
+        if state._circuit is None:          # Not created yet: restored as a fresh circuit
+            self.circuit = None
+        else:
+            self.circuit = state._circuit.checkpoint()
+
+    def blocks(self):
+        if self.circuit is None:
+            return []
+        return list({id(block): block for block in self.circuit["blocks"]}.values())
+
+
+# Ring buffer of checkpoints, the oldest ones are dropped once there are more than capacity
+# checkpoints or once the blocks they keep alive take more than budget bytes
+class CheckpointBuffer:
+    def __init__(self, capacity=CHECKPOINT_CAPACITY, budget=CHECKPOINT_BUDGET):
+        self.capacity = capacity
+        self.budget = budget
+        self.checkpoints = deque()
+        self.references = {}        # id(block) -> [block, number of checkpoints using it]
+        self.nbytes = 0
+
+    def __len__(self):
+        return len(self.checkpoints)
+
+    def __getitem__(self, index):
+        return self.checkpoints[index]
+
+    def push(self, checkpoint):
+        if len(self.checkpoints) > 0 and self.checkpoints[-1].owners == checkpoint.owners:
+            checkpoint.owners = self.checkpoints[-1].owners
+        self.checkpoints.append(checkpoint)
+        for block in checkpoint.blocks():
+            reference = self.references.setdefault(id(block), [block, 0])
+            if reference[1] == 0:
+                self.nbytes += block.nbytes
+            reference[1] += 1
+        while len(self.checkpoints) > 1 and (len(self.checkpoints) > self.capacity or self.nbytes > self.budget):
+            self.release(self.checkpoints.popleft())
+
+    # Remove the checkpoints taken after the given index (rewinding drops the undone future)
+    def truncate(self, index):
+        while len(self.checkpoints) > index + 1:
+            self.release(self.checkpoints.pop())
+
+    def release(self, checkpoint):
+        for block in checkpoint.blocks():
+            reference = self.references[id(block)]
+            reference[1] -= 1
+            if reference[1] == 0:
+                del self.references[id(block)]
+                self.nbytes -= block.nbytes
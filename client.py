@@ -0,0 +1,169 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+
+from engine import PHASE_PLACING
+from moves import PlacingMove
+from server import DEFAULT_PORT
+
+
+class ServerError(ValueError):
+    pass
+
+
+# Client of a server.GameServer, one request at a time on its connection
+class GameClient:
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.next_id = 1
+
+    @classmethod
+    async def connect(cls, host="127.0.0.1", port=DEFAULT_PORT):
+        reader, writer = await asyncio.open_connection(host, port)
+        return cls(reader, writer)
+
+    # Send a request and wait for its response, raises ServerError if the server refused it
+    async def request(self, op, **fields):
+        request_id = self.next_id
+        self.next_id += 1
+        self.writer.write((json.dumps({"op": op, "id": request_id, **fields}) + "\n").encode())
+        await self.writer.drain()
+        line = await self.reader.readline()
+        if len(line) == 0:
+            raise ConnectionError("connection closed by the server")
+        response = json.loads(line)
+        if not response["ok"]:
+            raise ServerError(response["error"])
+        return response
+
+    async def close(self):
+        self.writer.close()
+        await self.writer.wait_closed()
+
+
+# Stand-in for a player: opens a session and plays random legal actions, like the computer
+# rollouts, with a few measurements and odds queries. Returns the latency of every action.
+async def play_session(host, port, actions, seed):
+    rng = random.Random(seed)
+    client = await GameClient.connect(host, port)
+    view = await client.request("new", seed=seed)
+    session, owners = view["session"], view["owners"]
+    latencies = []
+    try:
+        for _ in range(actions):
+            player = view["player"]
+            own = [name for name, owner in owners.items() if owner == player]
+            enemy = [name for name, owner in owners.items() if owner != player]
+            if view["phase"] == PHASE_PLACING:
+                gate = rng.choice(view["moves"])
+                fields = {"gate": gate, "country1": rng.choice(own)}
+                if PlacingMove(gate).is_double_gate():
+                    fields["country2"] = rng.choice(enemy)
+                op = "place"
+            elif rng.random() < 0.1:
+                fields = {"measurements": [[name, 0, rng.choice("XYZ")] for name in rng.sample(own + enemy, 3)]}
+                op = "measure"
+            elif rng.random() < 0.2:
+                fields = {"attacker": rng.choice(own), "defender": rng.choice(enemy)}
+                op = "odds"
+            elif len(view["swaps"]) > 0 and rng.random() < 0.7:
+                fields = dict(zip(("country1", "country2"), rng.choice(view["swaps"])))
+                op = "swap"
+            else:
+                fields = {}
+                op = "end_phase"
+
+            start = time.perf_counter()
+            response = await client.request(op, session=session, **fields)
+            latencies.append(time.perf_counter() - start)
+            if op != "odds":
+                view = response
+        await client.request("close", session=session)
+    finally:
+        await client.close()
+    return latencies
+
+
+# Play the given amount of concurrent sessions, returns their latencies and the elapsed time
+async def run_load(host, port, sessions, actions, seed):
+    start = time.perf_counter()
+    results = await asyncio.gather(*(play_session(host, port, actions, seed + i) for i in range(sessions)))
+    return [latency for latencies in results for latency in latencies], time.perf_counter() - start
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+# Start a local server in another process and wait until it accepts connections
+def spawn_server(port, workers):
+    command = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "server.py"), "--port", str(port)]
+    if workers is not None:
+        command += ["--workers", str(workers)]
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL)
+    deadline = time.monotonic() + 30
+
+    async def wait():
+        while True:
+            try:
+                client = await GameClient.connect(port=port)
+                await client.close()
+                return
+            except OSError:
+                if process.poll() is not None or time.monotonic() > deadline:
+                    raise
+                await asyncio.sleep(0.1)
+
+    asyncio.run(wait())
+    return process
+
+
+async def server_info(host, port):
+    client = await GameClient.connect(host, port)
+    try:
+        return await client.request("info")
+    finally:
+        await client.close()
+
+
+# Load generator: doubles the concurrent sessions until the p99 action latency goes over the
+# target, then reports how many sessions each server core sustains
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test a Quantum Risk server with simulated players")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--spawn", action="store_true", help="start a local server for the test")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes of the spawned server")
+    parser.add_argument("--actions", type=int, default=100, help="actions played by each session")
+    parser.add_argument("--max-sessions", type=int, default=256)
+    parser.add_argument("--target-p99", type=float, default=50.0, help="p99 action latency target, in ms")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    process = spawn_server(args.port, args.workers) if args.spawn else None
+    try:
+        workers = asyncio.run(server_info(args.host, args.port))["workers"]
+        print(f"{'sessions':>8}{'actions/s':>12}{'p50 ms':>10}{'p99 ms':>10}")
+        sustained = 0
+        sessions = 1
+        while sessions <= args.max_sessions:
+            latencies, elapsed = asyncio.run(run_load(args.host, args.port, sessions, args.actions, args.seed))
+            p99 = percentile(latencies, 0.99) * 1000
+            print(f"{sessions:>8}{len(latencies) / elapsed:>12.0f}{percentile(latencies, 0.5) * 1000:>10.2f}{p99:>10.2f}")
+            if p99 > args.target_p99:
+                break
+            sustained = sessions
+            sessions *= 2
+        print(f"{sustained} sessions on {workers} workers: {sustained / workers:.1f} sessions per core "
+              f"at p99 <= {args.target_p99:g} ms")
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
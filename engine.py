@@ -0,0 +1,228 @@
+import importlib
+import sys
+import threading
+import metrics
+from checkpoint import CHECKPOINT_BUDGET, CHECKPOINT_CAPACITY, Checkpoint, CheckpointBuffer
+from moves import PlacingMove, get_player_placing_moves
+
+PHASE_PLACING = 1
+PHASE_ATTACKING = 2
+PHASE_MOVING = 3
+
+# The quantum backend (quantum.py and numpy) is the slowest import of the game: it is
+# loaded on first use, or in the background by warm_up_backend while the window opens.
+backend_loader = None
+
+
+def warm_up_backend():
+    global backend_loader
+    if backend_loader is None and "quantum" not in sys.modules:
+        backend_loader = threading.Thread(target=importlib.import_module, args=("quantum",), daemon=True)
+        backend_loader.start()
+
+
+def backend_loading():
+    return backend_loader is not None and backend_loader.is_alive()
+
+
+# Headless game state and rules: ownership lives in the World, the quantum state in the
+# GameCircuit. It has no dependency on tkinter, the UI in game.py is a view on top of it.
+#
+# Every action played on the state is appended to log (any object with an append method,
+# e.g. a list or a movelog.MoveLog) as a dict, so that movelog.replay can play it again.
+# seed seeds the measurements of the circuit created by the state.
+# Once enabled, a checkpoint is taken at every phase boundary so that moves can be undone.
+class GameState:
+    def __init__(self, world, circuit=None, seed=None, log=None):
+        self.world = world
+        self._circuit = circuit
+        self.seed = seed
+        self.log = log
+        self.actions = 0            # Number of actions played, see record
+        self.checkpoints = None     # CheckpointBuffer, see enable_checkpoints
+        self.current_player = 1
+        self.phase = PHASE_PLACING
+        self.turn = 1
+        self.current_moves = get_player_placing_moves(self.world, self.current_player)
+
+    # The circuit is created on first use, so the state can be built before the backend is loaded
+    @property
+    def circuit(self):
+        if self._circuit is None:
+            from quantum import GameCircuit
+            metrics.install_hooks()
+            self._circuit = GameCircuit(self.world.get_qubit_amount(), self.seed)
+        return self._circuit
+
+    # Copies of the state (e.g. the rollouts of the computer players) do not write to the log
+    # and do not keep checkpoints
+    def __getstate__(self):
+        return {**self.__dict__, "log": None, "checkpoints": None}
+
+    def record(self, action, **entry):
+        self.actions += 1
+        if self.log is not None:
+            self.log.append({"action": action, "player": self.current_player, "turn": self.turn, **entry})
+
+    def get_opponent(self):
+        return (self.current_player % 2) + 1
+
+    # Index of the qubit of a country, checked so that a bad move never changes the state
+    def qubit(self, country, index):
+        if not isinstance(index, int) or not 0 <= index < len(country.qubits):
+            raise ValueError(f"{country.name} has no qubit {index}")
+        return country.qubits[index]
+
+    # All the fully specified placing moves the current player can play
+    def legal_placements(self):
+        if self.phase != PHASE_PLACING:
+            return []
+        own = [c.name for c in self.world.get_all_possessions(self.current_player)]
+        enemy = [c.name for c in self.world.get_all_possessions(self.get_opponent())]
+
+        placements = []
+        for gate in dict.fromkeys(move.gate for move in self.current_moves):
+            for country1 in own:
+                for country2 in (enemy if PlacingMove(gate).is_double_gate() else [""]):
+                    move = PlacingMove(gate)
+                    move.country1 = country1
+                    move.country2 = country2
+                    placements.append(move)
+        return placements
+
+    # All the (country1, country2) pairs the current player can swap troops between
+    def legal_swaps(self):
+        if self.phase != PHASE_MOVING:
+            return []
+        own = [c.name for c in self.world.get_all_possessions(self.current_player)]
+        swaps = []
+        for a in own:
+            connected = self.world.get_connected_countries(a)
+            swaps.extend((a, b) for b in own if b != a and b in connected)
+        return swaps
+
+    # Play a placing move: country1 is a country of the current player, country2 (for double
+    # gates) an enemy country controlling it. The phase ends once every move is placed.
+    def place(self, move):
+        if self.phase != PHASE_PLACING:
+            raise ValueError("Moves can only be placed during the placing phase")
+        pending = next((m for m in self.current_moves if m is move), None)
+        if pending is None:
+            pending = next((m for m in self.current_moves if m.gate == move.gate), None)
+        if pending is None:
+            raise ValueError(f"Gate {move.gate} is not available to player {self.current_player}")
+        country1 = self.world.get_country(move.country1)
+        if not country1.is_owned(self.current_player):
+            raise ValueError(f"{move.country1} is not owned by player {self.current_player}")
+
+        if not move.is_double_gate():
+            self.circuit.apply_single_gate(move.gate, self.qubit(country1, move.qubit1))
+        else:
+            country2 = self.world.get_country(move.country2)
+            if not country2.is_owned(self.get_opponent()):
+                raise ValueError(f"{move.country2} is not owned by player {self.get_opponent()}")
+            self.circuit.apply_double_gate(move.gate, self.qubit(country2, move.qubit2), self.qubit(country1, move.qubit1))
+
+        self.record("place", gate=move.gate, country1=move.country1, country2=move.country2,
+                    qubit1=move.qubit1, qubit2=move.qubit2)
+        self.current_moves.remove(pending)
+        if len(self.current_moves) == 0:
+            self.next_phase()
+
+    # Swap troops between two connected countries of the current player, which ends the turn
+    def swap(self, country1, country2, qubit1=0, qubit2=0):
+        if self.phase != PHASE_MOVING:
+            raise ValueError("Troops can only be swapped during the moving phase")
+        if not self.world.get_country(country1).is_owned(self.current_player):
+            raise ValueError(f"{country1} is not owned by player {self.current_player}")
+        if not self.world.are_connected(country1, country2):
+            raise ValueError(f"{country1} and {country2} are not connected")
+
+        self.circuit.apply_swap(self.qubit(self.world.get_country(country1), qubit1),
+                                self.qubit(self.world.get_country(country2), qubit2))
+        self.record("swap", country1=country1, country2=country2, qubit1=qubit1, qubit2=qubit2)
+        self.next_phase()
+
+    # Measure (country, qubit, basis) triples jointly, returns the +1/-1 outcomes
+    def measure(self, measurements):
+        qubits = [(self.qubit(self.world.get_country(country), qubit), basis) for country, qubit, basis in measurements]
+        outcomes = self.circuit.measure_many(qubits)
+        self.record("measure", measurements=[list(m) for m in measurements], outcomes=outcomes)
+        return outcomes
+
+    # Odds of an attack of a country on another one: every qubit of both countries is measured
+    # in the basis of its side, the side with the highest sum of +1/-1 outcomes wins.
+    # Returns the exact (win, draw, loss) probabilities of the attacker, without collapsing
+    # the state; the distribution is cached by the circuit until the next gate.
+    def battle_odds(self, attacker, defender, attack_basis="Z", defense_basis="Z"):
+        qubits1 = self.world.get_country(attacker).qubits
+        qubits2 = self.world.get_country(defender).qubits
+        measurements = [(q, attack_basis) for q in qubits1] + [(q, defense_basis) for q in qubits2]
+        probabilities = self.circuit.outcome_probabilities(measurements).reshape(-1).tolist()
+
+        odds = [0.0, 0.0, 0.0]
+        for index, probability in enumerate(probabilities):
+            ones1 = bin(index >> len(qubits2)).count("1")
+            ones2 = bin(index & ((1 << len(qubits2)) - 1)).count("1")
+            difference = (2 * ones1 - len(qubits1)) - (2 * ones2 - len(qubits2))
+            odds[0 if difference > 0 else 1 if difference == 0 else 2] += probability
+        return tuple(odds)
+
+    # Called when a player ends the current phase before playing every move
+    def end_phase(self):
+        self.record("end_phase")
+        self.next_phase()
+
+    # Placing -> moving -> placing of the next player (the attack phase is not played yet)
+    def next_phase(self):
+        if self.phase == PHASE_PLACING:
+            self.phase = PHASE_MOVING
+        else:
+            metrics.turn_finished(self)
+            self.current_player = self.get_opponent()
+            self.phase = PHASE_PLACING
+            self.turn += 1
+            self.current_moves = get_player_placing_moves(self.world, self.current_player)
+        if self.checkpoints is not None:
+            self.checkpoints.push(Checkpoint(self))
+
+    # Start taking checkpoints, the first one is the current state
+    def enable_checkpoints(self, capacity=CHECKPOINT_CAPACITY, budget=CHECKPOINT_BUDGET):
+        self.checkpoints = CheckpointBuffer(capacity, budget)
+        self.checkpoints.push(Checkpoint(self))
+
+    # Go back to the start of the current phase, or of the previous phase if nothing was played
+    # since the current one started. With players, go back to a phase of one of these players.
+    # Returns False when there is no checkpoint to go back to.
+    def undo(self, players=None):
+        if self.checkpoints is None:
+            return False
+        index = len(self.checkpoints) - 1
+        if self.checkpoints[index].actions == self.actions:
+            index -= 1
+        while index >= 0 and players is not None and self.checkpoints[index].current_player not in players:
+            index -= 1
+        if index < 0:
+            return False
+        self.rewind(index)
+        return True
+
+    # Restore the checkpoint of the given index, the later checkpoints are dropped.
+    # Only references are restored, whatever the amount of moves played since the checkpoint.
+    def rewind(self, index):
+        checkpoint = self.checkpoints[index]
+        self.record("rewind", to_actions=checkpoint.actions)
+        self.checkpoints.truncate(index)
+
+        self.turn = checkpoint.turn
+        self.phase = checkpoint.phase
+        self.current_player = checkpoint.current_player
+        self.actions = checkpoint.actions
+        self.current_moves = [PlacingMove(gate) for gate in checkpoint.moves]
+        for country, owner in zip(self.world.get_all_countries(), checkpoint.owners):
+            if country.owner != owner:
+                self.world.set_owner(country.name, owner)
+        if checkpoint.circuit is None:
+            self._circuit = None
+        else:
+            self.circuit.restore(checkpoint.circuit)
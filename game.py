@@ -1,170 +1,278 @@
-from quantum import *
 from moves import *
 from graph import *
+from engine import *
+from view import *
 
 PHASE_TITLES = ["Placing Troops", "Attacking", "Moving Troops"]
 PHASE_BUTTONS = ["Start Attacking", "End Attacks", "End Turn"]
 
+# Tkinter UI playing a GameState: all the rules live in the state, the UI only
+# collects the selections of the players and renders the world.
+# Turns are event driven: selections, the Confirm button and the phase button call
+# the transitions directly, nothing runs while no player does anything.
 class GameInstance:
-    def __init__(self, world, circuit=None):
+    def __init__(self, world, circuit=None, ai_players=None, state=None, autosave=None):
+        self.state = state if state is not None else GameState(world, circuit)
+        if self.state.checkpoints is None:
+            self.state.enable_checkpoints()
         self.world = world
-        if circuit is None:
-            self.circuit = GameCircuit(self.world.get_qubit_amount())
-        else:
-            self.circuit = circuit
-        self.current_moves = None
+        self.view = WorldView(world)
+        self.view.on_select = self.on_select
+        self.view.on_hover = self.on_hover
         self.selected_move = None
-        self.confirmed = False
         self.confirm_button = None
-        self.should_continue = False
-        self.current_player = 0
         self.next_step_button = None
+        self.undo_button = None
         self.troop_swap = None
+        self.ai_players = ai_players or {}     # Computer players, by player number
+        self.ai_decision = None                 # Future of the move the computer is thinking about
+        self.rendered_moves = []                # Moves whose buttons are on the canvas
+        self.autosave = autosave                # Snapshot file rewritten after every move, see snapshot.py
+        self.moves_title = self.view.canvas.create_text(110, 620, text="Available Gates", font=("Helvetica", 12, "bold"),
+                                                        fill="black", state="hidden")
+
+    @property
+    def circuit(self):
+        return self.state.circuit
+
+    @property
+    def current_player(self):
+        return self.state.current_player
+
+    @property
+    def current_moves(self):
+        return self.state.current_moves
+
+    # Expected Z measurement observable of each country, averaged over its qubits
+    def update_troop_strength(self):
+        if backend_loading():       # The map is shown first, the strengths once the backend is loaded
+            self.execute_later(self.refresh_troop_strength, 20)
+            return
+        bloch = self.circuit.country_bloch_vectors(self.world.get_all_countries())
+        self.view.troop_strength = {name: -float(vectors[:, 2].mean()) for name, vectors in bloch.items()}
+
+    def save(self):
+        if self.autosave is not None:
+            from snapshot import save_snapshot
+            save_snapshot(self.state, self.autosave)
+
+    def refresh_troop_strength(self):
+        self.update_troop_strength()
+        self.view.render()
+
+    # Called by the view when a player selects a country
+    def on_select(self, country):
+        if self.state.phase == PHASE_PLACING:
+            self.render_moves()
+        else:
+            self.troop_swap.render(self.view)
+        self.ask_for_confirmation()
+
+    # Called by the view when the mouse enters (or leaves, with None) a country: over an enemy
+    # neighbour of the selected country, the odds of attacking it are shown
+    def on_hover(self, country):
+        attacker = self.view.selection
+        if country is None or attacker == "" or not self.world.are_neighbours(attacker, country) \
+                or not self.world.get_country(attacker).is_owned(self.current_player) \
+                or not self.world.get_country(country).is_owned(self.state.get_opponent()):
+            self.view.hide_tooltip()
+            return
+        win, draw, loss = self.state.battle_odds(attacker, country)
+        self.view.show_tooltip(self.world.get_country(country), f"Win {win:.0%}  Draw {draw:.0%}  Loss {loss:.0%}")
 
     def confirm(self):
-        self.confirmed = True
+        self.reset_confirmation()
+        if self.view.selection.strip() == "" or self.current_player in self.ai_players:
+            return
+        if self.state.phase == PHASE_PLACING:
+            self.confirm_move()
+        else:
+            self.confirm_troop_swap()
+
+    def confirm_move(self):
+        if self.selected_move is None:
+            return
+        if self.selected_move.select_country(self.view.selection):
+            self.execute_move(self.selected_move)
+            self.continue_placing()
+        elif self.selected_move.country1 != "":
+            self.view.allow_selection(True, self.current_player, True)
+            self.render_moves()
+
+    def confirm_troop_swap(self):
+        if self.troop_swap.select_country(self.view, self.view.selection):
+            self.execute_troop_swap(self.troop_swap)
+            self.end_turn()
+        else:
+            self.troop_swap.render(self.view)
 
+    # Called by the phase button
     def stop(self):
-        self.should_continue = False
+        self.ai_decision = None
+        if self.state.phase == PHASE_PLACING:
+            self.state.end_phase()
+            self.move_troops()
+        else:
+            self.end_turn()
+
+    # Called by the Undo button: back to the start of the last phase of a human player,
+    # the moves of the computer players played since are undone too
+    def undo(self):
+        humans = [player for player in (1, 2) if player not in self.ai_players]
+        if not self.state.undo(humans):
+            return
+        self.ai_decision = None
+        self.selected_move = None
+        self.view.hide_tooltip()
+        if self.state.phase == PHASE_PLACING:
+            self.place_troops()
+        else:
+            self.move_troops()
 
     def reset_confirmation(self):
-        self.confirmed = False
         if self.confirm_button is not None:
             self.confirm_button.destroy()
             self.confirm_button = None
 
     def ask_for_confirmation(self):
         if self.confirm_button is None:
-            self.confirm_button = Button(self.world.root, text="Confirm", command=lambda: self.confirm())
+            self.confirm_button = Button(self.view.root, text="Confirm", command=lambda: self.confirm())
             self.confirm_button.pack()
 
     def render_moves(self):
-        self.world.canvas.delete("move")
-        self.world.canvas.create_text(110, 620, text="Available Gates", font=("Helvetica", 12, "bold"), fill="black", tags="move")
+        for move in self.rendered_moves:
+            if move not in self.current_moves:
+                move.clear(self.view)
+        self.rendered_moves = list(self.current_moves)
+
+        self.view.canvas.itemconfig(self.moves_title, state="normal")
         render_positions = get_move_render_positions(30, 650, len(self.current_moves))
         for i, move in enumerate(self.current_moves):
             x, y = render_positions[i]
-            move.render(self.world, x, y, lambda m: self.select_move(m))
-        self.world.root.update()
+            move.render(self.view, x, y, lambda m: self.select_move(m))
+
+        if self.selected_move is not None:
+            self.selected_move.render_pointer(self.view)
+        else:
+            self.view.hide_pointer()
+
+    def clear_moves(self):
+        for move in self.rendered_moves:
+            move.clear(self.view)
+        self.rendered_moves = []
+        self.view.canvas.itemconfig(self.moves_title, state="hidden")
+        self.view.hide_pointer()
 
     def select_move(self, move):
-        if move.selected:
+        if move.selected or self.current_player in self.ai_players:
             return
-        self.world.allow_selection(True, self.current_player)
+        self.view.allow_selection(True, self.current_player)
         self.selected_move = move
         for m in self.current_moves:
             m.set_selected(m == move)
         self.render_moves()
 
     def execute_move(self, move):
-        print(move)
-        country1 = self.world.get_country(move.country1)
-        if not move.is_double_gate():
-            self.circuit.apply_single_gate(move.gate, country1.qubits[move.qubit1])
-        else:
-            country2 = self.world.get_country(move.country2)
-            self.circuit.apply_double_gate(move.gate, country2.qubits[move.qubit2], country1.qubits[move.qubit1])
-
-        self.current_moves.remove(move)
+        self.state.place(move)
         self.selected_move = None
-        self.world.allow_selection(False)
-        self.world.render()
+        self.view.allow_selection(False)
+        self.refresh_troop_strength()
+        self.save()
 
 
     def execute_troop_swap(self, troop_swap):
-        print(troop_swap)
-        qubit1 = self.world.get_country(troop_swap.country1).qubits[troop_swap.qubit1]
-        qubit2 = self.world.get_country(troop_swap.country2).qubits[troop_swap.qubit2]
-        self.circuit.apply_swap(qubit1, qubit2)
-        self.world.allow_selection(False)
-        self.world.render()
+        self.state.swap(troop_swap.country1, troop_swap.country2, troop_swap.qubit1, troop_swap.qubit2)
+        self.view.allow_selection(False)
+        self.refresh_troop_strength()
 
 
     def execute_later(self, function, time):
-        self.world.root.after(time, function)
+        self.view.root.after(time, function)
 
 
-    def place_troops_iteration(self):
-        if len(self.current_moves) <= 0:
-            self.should_continue = False
+    # Start the search of the computer if it plays the current phase
+    def start_ai(self):
+        if self.current_player not in self.ai_players:
+            return
+        self.ai_decision = self.ai_players[self.current_player].choose_async(self.state)
+        self.wait_for_ai(self.ai_decision)
+
+    # The only polling left: while the computer thinks, its decision is checked every 50 ms
+    def wait_for_ai(self, decision):
+        if decision is not self.ai_decision:    # The phase was ended in the meantime
+            return
+        if not decision.done():
+            self.execute_later(lambda: self.wait_for_ai(decision), 50)
+            return
+        self.ai_decision = None
+        try:
+            choice = decision.result()
+        except Exception as error:      # The turn goes on without the computer move
+            print(f"[WARNING] Computer player {self.current_player} failed to choose: {error!r}")
+            choice = None
+        if self.state.phase == PHASE_PLACING:
+            if choice is None:          # No legal placement left
+                self.state.end_phase()
+            else:
+                self.execute_move(choice)
+            self.continue_placing()
+        else:
+            if choice is not None:
+                self.troop_swap.country1, self.troop_swap.country2 = choice
+                self.execute_troop_swap(self.troop_swap)
+            self.end_turn()
 
-        if self.should_continue:
+    # After a placed move: next move, or moving phase once every move is placed
+    def continue_placing(self):
+        if self.state.phase == PHASE_PLACING and len(self.current_moves) == 0:
+            self.state.end_phase()
+        if self.state.phase == PHASE_PLACING:
             self.render_moves()
-            if self.world.selection.strip() != "":
-                self.ask_for_confirmation()
-                if self.confirmed:
-                    self.reset_confirmation()
-
-                    if self.selected_move.select_country(self.world.selection):
-                        self.execute_move(self.selected_move)
-                        self.execute_later(self.place_troops_iteration, 1)
-                        return
-                    else:
-                        if self.selected_move.country1 != "":
-                            self.world.allow_selection(True, self.current_player, True)
-            self.execute_later(self.place_troops_iteration, 50)
+            self.start_ai()
         else:
             self.move_troops()
 
-    def move_troops_iteration(self):
-        if self.should_continue:
-            self.troop_swap.render(self.world)
-            if self.world.selection.strip() != "":
-                self.ask_for_confirmation()
-                if self.confirmed:
-                    self.reset_confirmation()
-                    if self.troop_swap.select_country(self.world, self.world.selection):
-                        self.execute_troop_swap(self.troop_swap)
-                        self.stop()
-                        self.execute_later(self.move_troops_iteration, 1)
-                        return
-            self.execute_later(self.move_troops_iteration, 50)
-        else:
-            self.world.canvas.delete("swap")
-            self.next_step_button.destroy()
-            self.next_step_button = None
-            self.switch_player()
-            self.place_troops()
+    def end_turn(self):
+        self.view.hide_pointer()
+        self.view.highlight(())
+        if self.state.phase == PHASE_MOVING:
+            self.state.end_phase()
+        self.place_troops()
 
     def setup_turn_phase(self, phase):
         if phase < 1 or phase > 3:
             return
-        self.world.allow_selection(False)
-        self.world.selection = ""
-        self.world.render()
-        self.world.canvas.delete("turn")
-        text = f"Phase {phase} : {PHASE_TITLES[phase-1]}"
-        self.world.canvas.create_text(self.world.size // 2, 20, text=text, font=("Helvetica", 20),
-                                      fill=COLORS[self.current_player], tags="turn")
-        self.should_continue = True
+        self.reset_confirmation()
+        self.view.allow_selection(False)
+        self.view.selection = ""
+        self.refresh_troop_strength()
+        self.save()
+        self.view.set_turn_text(f"Phase {phase} : {PHASE_TITLES[phase-1]}", COLORS[self.current_player])
 
         if self.next_step_button is not None:
             self.next_step_button.destroy()
 
-        self.next_step_button = Button(self.world.root, text=PHASE_BUTTONS[phase-1], command=lambda: self.stop())
+        self.next_step_button = Button(self.view.root, text=PHASE_BUTTONS[phase-1], command=lambda: self.stop())
         self.next_step_button.pack(side=LEFT if self.current_player == 1 else RIGHT)
 
 
     def place_troops(self):
         self.setup_turn_phase(1)
-        self.current_moves = get_player_placing_moves(self.world, self.current_player)
-        self.place_troops_iteration()
+        self.selected_move = None
+        self.continue_placing()
 
     def move_troops(self):
         self.setup_turn_phase(3)
         self.troop_swap = TroopSwap()
-        self.world.allow_selection(True, self.current_player)
-        self.world.canvas.delete("move")
-        self.move_troops_iteration()
-
-    def switch_player(self):
-        self.current_player = (self.current_player % 2) + 1
+        self.view.allow_selection(True, self.current_player)
+        self.clear_moves()
+        self.start_ai()
 
     def play(self):
-            self.current_player = 1
-            self.place_troops()
-            self.world.root.mainloop()
-
-
-
-
+            self.undo_button = Button(self.view.root, text="Undo", command=lambda: self.undo())
+            self.undo_button.pack(side=BOTTOM)
+            if self.state.phase == PHASE_PLACING:
+                self.place_troops()
+            else:
+                self.move_troops()
+            self.view.root.mainloop()
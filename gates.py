@@ -0,0 +1,7 @@
+# Names of the game gates, importable without the quantum backend (numpy and the simulator)
+# so that maps can be read and generated without it. quantum.py holds their unitaries.
+SINGLE_GATE_NAMES = ("X", "Y", "Z", "XY", "YZ", "XZ", "H")
+DOUBLE_GATE_NAMES = ("CX", "CY", "CZ", "CXY", "CYZ", "CXZ")
+
+# Gates a continent of several countries can give, its bonus being their controlled form
+CONTROLLED_GATE_NAMES = tuple(gate for gate in SINGLE_GATE_NAMES if f"C{gate}" in DOUBLE_GATE_NAMES)
@@ -1,7 +1,6 @@
-import networkx as nx
+import array
 import random
-from tkinter import *
-from PIL import Image, ImageTk
+from mapfile import load_map
 
 COLORS = ["gray", "blue", "red"]
 
@@ -20,14 +19,6 @@ class Continent:
 	def __str__(self):
 		return f"[{self.name}]:\n -> quantum gate: {self.gate}\n -> countries: {self.countries}"
 
-	def render(self, world):
-		x, y = self.x * world.size, self.y * world.size
-		label = f"continent:{self.name.replace(' ', '')}"
-		text = f"{self.name} ({self.gate})"
-		font = ("Helvetica", 13, "bold")
-		world.canvas.delete(label)
-		world.canvas.create_text(x, y, fill=self.color, text=text, tags=label, font=font)
-
 
 # Class storing all the attributes of a country
 class Country:
@@ -50,34 +41,171 @@ class Country:
 	def __str__(self):
 		return f"[{self.name} (located in {self.continent})]:\n -> {len(self.qubits)} qubits: {self.qubits}\n -> pos: ({self.x}, {self.y})\n -> owner: {self.owner}"
 
-	def render(self, world, selected=False):
-		x, y = self.x * world.size, self.y * world.size
-		size = 30 if selected else 20
-		label = f"country:{self.name.replace(' ', '')}"
-		world.canvas.delete(label)
-		world.canvas.delete(f"{label}-title")
-		world.canvas.create_oval(x - size, y - size, x + size, y + size, fill=COLORS[self.owner], tags=label)
-		if selected:
-			world.canvas.create_text(x, y - size - 10, text=self.name, font=("Helvetica", 10), tags=f"{label}-title")
-		world.canvas.tag_bind(label, "<Button-1>", lambda e: world.select(self.name))
-
-# Class storing all the continents and country graph
+# Union-find of the countries of each player, connected through countries of the same owner.
+# Gaining a country only unions it with its neighbours; losing one marks the player for a
+# rebuild of its own components, done lazily on the next query.
+class ConnectivityIndex:
+	def __init__(self, country_graph):
+		self.country_graph = country_graph
+		self.owners = {}		# Country name -> owner
+		self.parent = {}		# Country name -> parent in the union-find of its owner
+		self.members = {}		# Root country name -> names of the countries of its component
+		self.dirty = set()		# Players whose components must be rebuilt
+
+	def find(self, country):
+		root = country
+		while self.parent[root] != root:
+			root = self.parent[root]
+		while self.parent[country] != root:		# Path compression
+			self.parent[country], country = root, self.parent[country]
+		return root
+
+	def union(self, country1, country2):
+		root1, root2 = self.find(country1), self.find(country2)
+		if root1 == root2:
+			return
+		if len(self.members[root1]) < len(self.members[root2]):
+			root1, root2 = root2, root1
+		self.parent[root2] = root1
+		self.members[root1] |= self.members.pop(root2)
+
+	def add(self, country, player):
+		self.owners[country] = player
+		self.parent[country] = country
+		self.members[country] = {country}
+		if player in self.dirty:
+			return
+		for neighbour in self.country_graph.neighbors(country):
+			if self.owners.get(neighbour) == player:
+				self.union(country, neighbour)
+
+	def set_owner(self, country, player):
+		previous = self.owners.get(country)
+		if previous == player:
+			return
+		if previous is not None:
+			self.dirty.add(previous)
+		self.add(country, player)
+
+	def rebuild(self, player):
+		self.dirty.discard(player)
+		countries = [c for c, owner in self.owners.items() if owner == player]
+		for country in countries:
+			self.parent[country] = country
+			self.members[country] = {country}
+		for country in countries:
+			for neighbour in self.country_graph.neighbors(country):
+				if self.owners.get(neighbour) == player:
+					self.union(country, neighbour)
+
+	def get_component(self, country):
+		if self.owners[country] in self.dirty:
+			self.rebuild(self.owners[country])
+		return self.members[self.find(country)]
+
+	def connected(self, country1, country2):
+		if self.owners[country1] != self.owners[country2]:
+			return False
+		if self.owners[country1] in self.dirty:
+			self.rebuild(self.owners[country1])
+		return self.find(country1) == self.find(country2)
+
+
+# Array form of a world next to its graph, country i being the i-th country of get_all_countries:
+# owners, continent ids, qubit offsets and the adjacency in CSR form (the neighbours of country i
+# are adjacency[adjacency_ptr[i]:adjacency_ptr[i + 1]]). The arrays are plain array.array,
+# numpy views on them are only made by the first bulk query, so loading a map stays numpy-free.
+# Enemies of a player are the countries owned by another player (neutral countries are not).
+class WorldArrays:
+	def __init__(self, names, continent_ids, qubit_offsets, adjacency_ptr, adjacency):
+		self.names = list(names)
+		self.index = {name: i for i, name in enumerate(self.names)}
+		self.continent_ids = array.array("i", continent_ids)
+		self.qubit_offsets = array.array("q", qubit_offsets)
+		self.adjacency_ptr = array.array("q", adjacency_ptr)
+		self.adjacency = array.array("i", adjacency)
+		self.owners = array.array("b", bytes(len(self.names)))	# Kept up to date by World.set_owner
+		self.views = None		# numpy views, see vectorize
+
+	# Arrays of a graph which was not loaded from a map file
+	@classmethod
+	def from_graph(cls, country_graph, continents):
+		names = list(country_graph.nodes())
+		index = {name: i for i, name in enumerate(names)}
+		continent_index = {name: i for i, name in enumerate(continents)}
+		countries = [country_graph.nodes[name]['country'] for name in names]
+		qubit_offsets, adjacency_ptr, adjacency = [0], [0], []
+		for name, country in zip(names, countries):
+			qubit_offsets.append(qubit_offsets[-1] + len(country.qubits))
+			adjacency.extend(sorted(index[neighbour] for neighbour in country_graph.neighbors(name)))
+			adjacency_ptr.append(len(adjacency))
+		return cls(names, [continent_index[c.continent] for c in countries], qubit_offsets, adjacency_ptr, adjacency)
+
+	# Copies (e.g. the states sent to the computer players) make their own views on their owners
+	def __getstate__(self):
+		return {**self.__dict__, "views": None}
+
+	# numpy views on the arrays: the owners view shares the memory of the owner array, and every
+	# adjacency entry gets its source country so that edge queries are single vectorized passes
+	def vectorize(self):
+		if self.views is None:
+			import numpy as np
+			counts = np.diff(np.frombuffer(self.adjacency_ptr, dtype=np.int64))
+			self.views = {
+				"owners": np.frombuffer(self.owners, dtype=np.int8),
+				"sources": np.repeat(np.arange(len(self.names), dtype=np.int32), counts),
+				"targets": np.frombuffer(self.adjacency, dtype=np.int32),
+			}
+		return self.views
+
+	# Adjacency entries (source, target) from a country of the player to an enemy one
+	def enemy_edges(self, player):
+		views = self.vectorize()
+		owners = views["owners"]
+		target_owners = owners[views["targets"]]
+		mask = (owners[views["sources"]] == player) & (target_owners != player) & (target_owners != 0)
+		return views["sources"][mask], views["targets"][mask]
+
+	# Indices of the countries of the player with at least one enemy neighbour
+	def frontier(self, player):
+		import numpy as np
+		frontier = np.zeros(len(self.names), dtype=bool)
+		frontier[self.enemy_edges(player)[0]] = True
+		return np.flatnonzero(frontier)
+
+	# (attacker, defender) index pairs of the attacks the player can make, as an (n, 2) array
+	def attack_pairs(self, player):
+		import numpy as np
+		return np.stack(self.enemy_edges(player), axis=1)
+
+	# Border length of every player, indexed by player: the amount of (own, enemy) neighbours
+	def border_lengths(self):
+		import numpy as np
+		views = self.vectorize()
+		owners = views["owners"]
+		source_owners, target_owners = owners[views["sources"]], owners[views["targets"]]
+		mask = (source_owners != target_owners) & (source_owners != 0) & (target_owners != 0)
+		return np.bincount(source_owners[mask], minlength=int(owners.max(initial=0)) + 1)
+
+
+# Class storing all the continents and country graph.
+# The world is headless: rendering and selection are handled by view.WorldView.
 class World:
-	def __init__(self, country_graph=None, continents=None, size=1200):
-		self.size = size
+	def __init__(self, country_graph=None, continents=None, arrays=None):
 		self.country_graph = country_graph	# The graph connecting all the countries
 		self.continents = continents		# A dict containing all the continents
-		self.root = Tk()					# The tkinter root object
-		self.root.title("Quantum Risk")
-		self.canvas = Canvas(self.root, width=size, height=int(size*0.75)) # The canvas
-		self.canvas.pack()
-		self.selection = ""					# The name of the selected country
-		self.can_select = False
-		self.selection_player = 0
-
-		image = Image.open("background.png")
-		image.thumbnail((size, int(size * 0.75)), Image.Resampling.LANCZOS)
-		self.background = ImageTk.PhotoImage(image)		# The background
+		self.arrays = arrays if arrays is not None else WorldArrays.from_graph(country_graph, continents)
+		self.connectivity = ConnectivityIndex(country_graph)	# Countries connected through a same owner
+		self.possessions = {}				# Player -> {name: country} of the countries it owns
+		self.owned_counts = {name: {} for name in continents}	# Continent -> {player: owned countries}
+		self.bonus = {}						# Player -> names of the continents giving it a bonus
+		self.continent_order = {name: index for index, name in enumerate(continents)}
+		self.qubit_amount = 0
+		for country in self.get_all_countries():
+			self.qubit_amount += len(country.qubits)
+			self.connectivity.add(country.name, country.owner)
+			self.add_possession(country, country.owner)
+			self.arrays.owners[self.arrays.index[country.name]] = country.owner
 
 	def get_country(self, name):
 		return self.country_graph.nodes[name]['country']
@@ -88,107 +216,99 @@ class World:
 	def get_all_countries(self):
 		return [node['country'] for _, node in self.country_graph.nodes(data=True)]
 
-	def initialize_random_ownership(self):
+	# rng is the random module or a random.Random, seeded for reproducible games
+	def initialize_random_ownership(self, rng=random):
 		amount = len(self.country_graph.nodes())
 		half = amount // 2
 		owners = [1 for _ in range(half)] + [2 for _ in range(amount - half)]
-		random.shuffle(owners)
+		rng.shuffle(owners)
 
 		index = 0
 		for country in self.get_all_countries():
-			country.owner = owners[index]
+			self.set_owner(country.name, owners[index])
 			index = index + 1
 
+	# Split the countries in two halves like initialize_random_ownership, but built so that
+	# bonus_player owns at least one whole continent (when one fits in its half)
+	def initialize_balanced_ownership(self, bonus_player=1, rng=random):
+		names = [country.name for country in self.get_all_countries()]
+		half = len(names) // 2
+		other_player = (bonus_player % 2) + 1
+		eligible = [c for c in self.continents.values() if 2 <= len(c.countries) <= half]
+		if len(eligible) == 0:
+			self.initialize_random_ownership(rng)
+			return
+
+		owned = set(rng.choice(eligible).countries)
+		rest = [name for name in names if name not in owned]
+		rng.shuffle(rest)
+		owned.update(rest[:half - len(owned)])
+		for name in names:
+			self.set_owner(name, bonus_player if name in owned else other_player)
+
+	# Change the owner of a country. Ownership must only change through this method, it keeps
+	# the connectivity index, the possessions and the continental bonus counters up to date.
+	def set_owner(self, name, player):
+		country = self.get_country(name)
+		if country.owner == player:
+			return
+		self.remove_possession(country, country.owner)
+		country.owner = player
+		self.add_possession(country, player)
+		self.connectivity.set_owner(name, player)
+		self.arrays.owners[self.arrays.index[name]] = player
+
+	def add_possession(self, country, player):
+		self.possessions.setdefault(player, {})[country.name] = country
+		counts = self.owned_counts[country.continent]
+		counts[player] = counts.get(player, 0) + 1
+		if self.has_continental_bonus(self.continents[country.continent], player):
+			self.bonus.setdefault(player, set()).add(country.continent)
+
+	def remove_possession(self, country, player):
+		del self.possessions[player][country.name]
+		self.owned_counts[country.continent][player] -= 1
+		self.bonus.get(player, set()).discard(country.continent)
+
 	def has_continental_bonus(self, continent, player):
 		if len(continent.countries) < 2: 	# Continents with only 1 country have no bonus
 			return False
-		for country in continent.countries:
-			if not self.get_country(country).is_owned(player):
-				return False
-		return True
+		return self.owned_counts[continent.name].get(player, 0) == len(continent.countries)
 
 	def get_all_continental_bonus(self, player):
-		bonus = []
-		for continent in self.continents.values():
-			if self.has_continental_bonus(continent, player):
-				bonus.append(f"C{continent.gate}")
-		return bonus
+		continents = sorted(self.bonus.get(player, ()), key=self.continent_order.get)
+		return [f"C{self.continents[name].gate}" for name in continents]
 
 	def get_all_possessions(self, player):
-		return [country for country in self.get_all_countries() if country.is_owned(player)]
+		return list(self.possessions.get(player, {}).values())
 
 	def get_qubit_amount(self):
-		return sum(len(country.qubits) for country in self.get_all_countries())
-
-	def render_edge(self, a, b):
-		country1 = self.get_country(a)
-		country2 = self.get_country(b)
-		x1, y1 = country1.x * self.size, country1.y * self.size
-		x2, y2 = country2.x * self.size, country2.y * self.size
-		labels = (f"edge-{country1.name}-{country2.name}", f"edge-{country2.name}-{country1.name}")
-		for l in labels:
-			self.canvas.delete(l)
-		if abs(x1 - x2) > self.size / 2:
-			self.canvas.create_line(x1, y1, 0, y1, fill="black", width=2, tags=labels)
-			self.canvas.create_line(self.size, y1, x2, y2, fill="black", width=2, tags=labels)
-		else:
-			self.canvas.create_line(x1, y1, x2, y2, fill="black", width=2, tags=labels)
-
-	def render_background(self):
-		self.canvas.delete("background")
-		self.canvas.create_image(0, 0, anchor="nw", image=self.background, tags="background")
-		self.canvas.tag_lower("background")
-
-	def render(self):
-		self.render_background()
-		for continent in self.continents.values():
-			continent.render(self)
-		for edge in self.country_graph.edges():
-			self.render_edge(*edge)
-		for country in self.get_all_countries():
-			country.render(self, country.name == self.selection)
+		return self.qubit_amount
 
-		self.canvas.tag_raise("move")
-		self.root.update()
-
-	def select(self, country):
-		if not self.can_select:
-			return
-		if self.get_country(country).is_owned(self.selection_player) or self.selection_player == 0:
-			self.selection = country
-			self.render()
-
-	def get_selected_country(self):
-		if self.selection == "":
-			return None
-		return self.get_country(self.selection)
-
-	def allow_selection(self, can_select, player=0, select_enemy=False):
-		self.can_select = can_select
-		self.selection_player = player if not select_enemy else (player % 2) + 1
-		if not can_select:
-			self.selection = ""
+	# Check if two countries share a border
+	def are_neighbours(self, country1, country2):
+		return self.country_graph.has_edge(country1, country2)
 
+	# Check if two countries are linked by a path of countries of the same owner
 	def are_connected(self, country1, country2):
-		# Get the colors of the two nodes
-		c1 = self.get_country(country1)
-		c2 = self.get_country(country2)
-		owner1 = c1.owner
-		owner2 = c2.owner
+		return self.connectivity.connected(country1, country2)
 
-		if owner1 != owner2:
-			return False
+	# Names of all the countries linked to the given one by countries of the same owner
+	def get_connected_countries(self, country):
+		return self.connectivity.get_component(country)
 
-		same_owner_nodes = [c.name for c in self.get_all_possessions(owner1)]
-		subgraph = self.country_graph.subgraph(same_owner_nodes)
+	# Names of the countries of the player with an enemy neighbour, see WorldArrays
+	def get_frontier(self, player):
+		return [self.arrays.names[i] for i in self.arrays.frontier(player).tolist()]
 
-		# Check if the two nodes are connected in this subgraph
-		return nx.has_path(subgraph, country1, country2)
+	# (attacker, defender) names of every country of the player next to an enemy one
+	def get_attack_pairs(self, player):
+		names = self.arrays.names
+		return [(names[a], names[b]) for a, b in self.arrays.attack_pairs(player).tolist()]
 
-	def show_temporary_message(self, text, color, time):
-		self.canvas.create_rectangle(0, self.size*3//8 - 20, self.size, self.size*3//8 + 20, fill="white", tags="temporary")
-		self.canvas.create_text(self.size//2, self.size*3//8, text=text, fill=color, tags="temporary", font=("Helvetica", 20))
-		self.root.after(time, lambda: self.canvas.delete("temporary"))
+	def get_border_length(self, player):
+		lengths = self.arrays.border_lengths()
+		return int(lengths[player]) if player < len(lengths) else 0
 
 
 
@@ -209,47 +329,33 @@ class World:
 # CONTINENTS
 # Continent1, Gate1
 # Continent2, Gate2
+#
+# The map is validated and compiled once to a binary file next to it (see mapfile.py),
+# later loads memory map the compiled file as long as the source is unchanged.
 def load_world(filename):
+	import networkx as nx
+	header, arrays = load_map(filename)
+	strings = header["strings"]
 	country_graph = nx.Graph()
 	continents_dict = {}
 
-	with open(filename, "r") as f:  # Open Risk file
-		lines = f.readlines()
-		edges_section = False
-		continents_section = False
-		current_qubit_index = 0
-
-		for line in lines:         # read line by line
-			line = line.strip()
-			if len(line) == 0:     # if line is empty, ignore
-				continue
-			if line == "EDGES":    # if line is "EDGES", switch to edge section
-				edges_section = True
-				continue
-			if line == "CONTINENTS":    # if line is "CONTINENTS", switch to continents section
-				continents_section = True
-				continue
-
-			if continents_section: 		# in continents section, map each continent to its corresponding quantum gate
-				name, gate, color, x, y = line.split(", ")
-				continent = continents_dict[name]
-				continent.gate = gate
-				continent.color = color
-				continent.x = float(x)
-				continent.y = float(y)
-
-			elif edges_section:			# in edges section, add an edge between 2 countries in the graph
-				country1, country2 = line.split(", ")
-				country_graph.add_edge(country1.strip(), country2.strip())
-
-			else:						# in countries section, add the country to the graph
-				name, qubits_amount, continent, x, y = line.split(", ")
-				qubits = [i + current_qubit_index for i in range(int(qubits_amount))]
-				current_qubit_index = current_qubit_index + int(qubits_amount)
-				country_graph.add_node(name, country=Country(name, qubits, continent, float(x), float(y)))
-
-				if continent not in continents_dict:	# create continent if it does not exist yet
-					continents_dict[continent] = Continent(continent)
-				continents_dict[continent].countries.append(name)
-
-	return World(country_graph, continents_dict)
+	continent_positions = arrays["continent_positions"].tolist()
+	for i, name in enumerate(strings["continents"]):
+		continent = Continent(name, gate=strings["gates"][i])
+		continent.color = strings["colors"][i]
+		continent.x, continent.y = continent_positions[i]
+		continents_dict[name] = continent
+
+	offsets = arrays["qubit_offsets"].tolist()
+	continent_ids = arrays["continent_ids"].tolist()
+	positions = arrays["positions"].tolist()
+	for i, name in enumerate(strings["countries"]):
+		continent = strings["continents"][continent_ids[i]]
+		qubits = list(range(offsets[i], offsets[i + 1]))
+		country_graph.add_node(name, country=Country(name, qubits, continent, *positions[i]))
+		continents_dict[continent].countries.append(name)
+
+	names = strings["countries"]
+	country_graph.add_edges_from((names[a], names[b]) for a, b in arrays["edges"].tolist())
+	world_arrays = WorldArrays(names, continent_ids, offsets, arrays["adjacency_ptr"], arrays["adjacency"])
+	return World(country_graph, continents_dict, world_arrays)
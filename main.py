@@ -1,8 +1,114 @@
+import argparse
+import random
+import subprocess
+import sys
+from engine import GameState, warm_up_backend
 from game import GameInstance
 from graph import *
 
+
+# Print the modules with the slowest imports when starting the game (this module, the map
+# loading and the quantum backend), measured with "python -X importtime" in a fresh interpreter
+def report_import_time(top=15):
+	code = "import main, quantum; main.load_world('risk_graph.txt')"
+	result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], capture_output=True, text=True)
+	imports = []
+	for line in result.stderr.splitlines():
+		if not line.startswith("import time:") or "self [us]" in line:
+			continue
+		own, cumulative, name = line[len("import time:"):].split("|")
+		imports.append((int(cumulative), int(own), name.strip()))
+	if len(imports) == 0:
+		print("[WARNING] No import times measured:", result.stderr.strip())
+		return
+	print(f"{'cumulative':>12}{'self':>12}  module")
+	for cumulative, own, name in sorted(imports, reverse=True)[:top]:
+		print(f"{cumulative / 1000:10.1f}ms{own / 1000:10.1f}ms  {name}")
+	print(f"total {sum(own for _, own, _ in imports) / 1000:.1f}ms in {len(imports)} modules")
+
+
+# Run the function under the chosen profiler (None: not profiled).
+# pyinstrument is optional, cProfile is used when it is not installed.
+def run_profiled(function, profiler=None, output=None):
+	if profiler == "pyinstrument":
+		try:
+			from pyinstrument import Profiler
+		except ImportError:
+			print("[WARNING] pyinstrument is not installed, profiling with cProfile")
+			profiler = "cprofile"
+		else:
+			profile = Profiler()
+			profile.start()
+			try:
+				function()
+			finally:
+				profile.stop()
+				if output is None:
+					print(profile.output_text(unicode=True, color=True))
+				else:
+					with open(output, "w") as f:
+						f.write(profile.output_html())
+			return
+	if profiler == "cprofile":
+		import cProfile
+		import pstats
+		profile = cProfile.Profile()
+		try:
+			profile.runcall(function)
+		finally:
+			if output is None:
+				pstats.Stats(profile).sort_stats("cumulative").print_stats(30)
+			else:
+				profile.dump_stats(output)
+		return
+	function()
+
+
 if __name__ == "__main__":
-	game_instance = GameInstance(load_world("risk_graph.txt"))
-	while len(game_instance.world.get_all_continental_bonus(1)) == 0:
-		game_instance.world.initialize_random_ownership()
-	game_instance.play()
\ No newline at end of file
+	parser = argparse.ArgumentParser(description="Quantum Risk")
+	parser.add_argument("--ai", type=int, nargs="*", default=[], choices=[1, 2], help="players played by the computer")
+	parser.add_argument("--ai-time", type=float, default=1.0, help="seconds the computer thinks about each move")
+	parser.add_argument("--save", help="snapshot file rewritten after every move")
+	parser.add_argument("--resume", help="continue the game of a snapshot file")
+	parser.add_argument("--seed", type=int, default=None, help="seed of the ownership and the measurements")
+	parser.add_argument("--log", help="move log the game is appended to, see movelog.py")
+	parser.add_argument("--metrics", help="append per-turn timing records to this JSON lines file")
+	parser.add_argument("--profile", choices=["cprofile", "pyinstrument"], help="profile the whole game")
+	parser.add_argument("--profile-output", help="file the profile is written to, printed by default")
+	parser.add_argument("--import-time", action="store_true", help="report the slowest imports and exit")
+	args = parser.parse_args()
+	if args.import_time:
+		report_import_time()
+		sys.exit()
+
+	warm_up_backend()		# numpy and the simulator load while the map and the window are built
+	ai_players = {}
+	if len(args.ai) > 0:
+		from ai import MonteCarloPlayer
+		ai_players = {player: MonteCarloPlayer(player, time_budget=args.ai_time) for player in args.ai}
+
+	world = load_world("risk_graph.txt")
+	log = None
+	if args.resume is not None:
+		from snapshot import load_snapshot
+		state = load_snapshot(args.resume, world)
+		if args.log is not None:
+			print("[WARNING] A resumed game is not logged, the log has to start with the game")
+	else:
+		seed = args.seed if args.seed is not None else random.randrange(2 ** 32)
+		world.initialize_balanced_ownership(1, random.Random(seed))
+		if args.log is not None:
+			from movelog import MoveLog
+			log = MoveLog(args.log)
+			state = log.start_game(world, "risk_graph.txt", seed)
+		else:
+			state = GameState(world, seed=seed)
+	if args.metrics is not None:
+		import metrics
+		metrics.enable(args.metrics)
+	game_instance = GameInstance(world, ai_players=ai_players, state=state, autosave=args.save)
+	run_profiled(game_instance.play, args.profile, args.profile_output)
+	for ai in ai_players.values():
+		ai.close()
+	if log is not None:
+		log.close()
@@ -0,0 +1,224 @@
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+
+from gates import CONTROLLED_GATE_NAMES, SINGLE_GATE_NAMES
+
+# Compiled map format:
+#
+# "QMAP" | version (uint32) | header length (uint64) | JSON header | arrays
+#
+# The JSON header holds the source file fingerprint, the strings (country and continent
+# names, gates, colors) and the offset, dtype and shape of every array. The arrays are
+# aligned on 8 bytes so they can be used straight from a memory map:
+#  - qubit_offsets   (countries + 1)   first qubit of each country, CSR style
+#  - continent_ids   (countries)       index of the continent of each country
+#  - positions       (countries, 2)    x, y of each country
+#  - adjacency_ptr   (countries + 1)   CSR adjacency: neighbours of country i are
+#  - adjacency       (2 * edges)         adjacency[adjacency_ptr[i]:adjacency_ptr[i+1]]
+#  - edges           (edges, 2)        edges in the order of the source file
+#  - continent_positions (continents, 2)
+MAGIC = b"QMAP"
+VERSION = 2				# Bumped whenever the validation rules change, older compiled maps are recompiled
+ALIGNMENT = 8
+
+# memoryview formats of the array dtypes, used to read compiled maps without numpy
+FORMATS = {"<i8": "q", "<i4": "i", "<f8": "d"}
+
+
+class MapError(ValueError):
+	pass
+
+
+# Parse and validate a text map, see graph.load_world for the format
+def parse_map(filename):
+	countries = {}			# name -> (qubits, continent, x, y), in file order
+	continents = {}			# name -> [gate, color, x, y], in order of first use
+	sizes = {}				# continent name -> number of countries
+	edges = []
+	section = "COUNTRIES"
+
+	def fail(number, message):
+		raise MapError(f"{filename}:{number}: {message}")
+
+	def parse_float(number, value, field):
+		try:
+			return float(value)
+		except ValueError:
+			fail(number, f"{field} must be a number, got '{value}'")
+
+	with open(filename, "r") as f:
+		for number, line in enumerate(f, start=1):
+			line = line.strip()
+			if len(line) == 0:
+				continue
+			if line in ("EDGES", "CONTINENTS"):
+				section = line
+				continue
+			fields = [field.strip() for field in line.split(",")]
+
+			if section == "COUNTRIES":
+				if len(fields) != 5:
+					fail(number, f"expected 'name, qubits, continent, x, y', got '{line}'")
+				name, qubits, continent, x, y = fields
+				if name in countries:
+					fail(number, f"duplicate country '{name}'")
+				if not qubits.isdigit() or int(qubits) < 1:
+					fail(number, f"qubit amount must be a positive integer, got '{qubits}'")
+				countries[name] = (int(qubits), continent, parse_float(number, x, "x"), parse_float(number, y, "y"))
+				continents.setdefault(continent, ["X", "black", 0.0, 0.0])
+				sizes[continent] = sizes.get(continent, 0) + 1
+
+			elif section == "EDGES":
+				if len(fields) != 2:
+					fail(number, f"expected 'country1, country2', got '{line}'")
+				for name in fields:
+					if name not in countries:
+						fail(number, f"unknown country '{name}'")
+				if fields[0] == fields[1]:
+					fail(number, f"country '{fields[0]}' cannot border itself")
+				edges.append((fields[0], fields[1]))
+
+			else:
+				if len(fields) != 5:
+					fail(number, f"expected 'continent, gate, color, x, y', got '{line}'")
+				name, gate, color, x, y = fields
+				if name not in continents:
+					fail(number, f"unknown continent '{name}'")
+				if gate not in SINGLE_GATE_NAMES:
+					fail(number, f"invalid gate '{gate}' for continent '{name}'")
+				# The bonus of a continent of several countries is the controlled form of its gate
+				if sizes[name] >= 2 and gate not in CONTROLLED_GATE_NAMES:
+					fail(number, f"gate '{gate}' of continent '{name}' has no controlled form for its {sizes[name]} countries")
+				continents[name] = [gate, color, parse_float(number, x, "x"), parse_float(number, y, "y")]
+
+	return countries, continents, edges
+
+
+def build_arrays(countries, continents, edges):
+	import numpy as np
+	names = list(countries.keys())
+	index = {name: i for i, name in enumerate(names)}
+	continent_index = {name: i for i, name in enumerate(continents.keys())}
+
+	qubit_offsets = np.zeros(len(names) + 1, dtype=np.int64)
+	qubit_offsets[1:] = np.cumsum([countries[name][0] for name in names])
+	continent_ids = np.array([continent_index[countries[name][1]] for name in names], dtype=np.int32)
+	positions = np.array([countries[name][2:] for name in names], dtype=np.float64).reshape(-1, 2)
+
+	unique_edges = {}
+	for a, b in edges:		# Duplicate edges (in any direction) are kept once
+		unique_edges.setdefault(frozenset((a, b)), (index[a], index[b]))
+	edge_array = np.array(list(unique_edges.values()), dtype=np.int32).reshape(-1, 2)
+	sources = np.concatenate([edge_array[:, 0], edge_array[:, 1]])
+	targets = np.concatenate([edge_array[:, 1], edge_array[:, 0]])
+	order = np.argsort(sources, kind="stable")
+	adjacency = targets[order].astype(np.int32)
+	adjacency_ptr = np.zeros(len(names) + 1, dtype=np.int64)
+	adjacency_ptr[1:] = np.cumsum(np.bincount(sources, minlength=len(names)))
+
+	continent_positions = np.array([c[2:] for c in continents.values()], dtype=np.float64).reshape(-1, 2)
+	arrays = {
+		"qubit_offsets": qubit_offsets,
+		"continent_ids": continent_ids,
+		"positions": positions,
+		"adjacency_ptr": adjacency_ptr,
+		"adjacency": adjacency,
+		"edges": edge_array,
+		"continent_positions": continent_positions,
+	}
+	strings = {
+		"countries": names,
+		"continents": list(continents.keys()),
+		"gates": [c[0] for c in continents.values()],
+		"colors": [c[1] for c in continents.values()],
+	}
+	return arrays, strings
+
+
+def source_fingerprint(filename):
+	stat = os.stat(filename)
+	with open(filename, "rb") as f:
+		digest = hashlib.sha256(f.read()).hexdigest()
+	return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": digest}
+
+
+# Validate a text map and write its compiled binary form
+def compile_map(source, target=None):
+	if target is None:
+		target = source + ".qmap"
+	fingerprint = source_fingerprint(source)
+	arrays, strings = build_arrays(*parse_map(source))
+
+	layout = {}
+	offset = 0
+	for name, array in arrays.items():
+		layout[name] = [offset, array.dtype.newbyteorder("<").str, list(array.shape)]
+		offset += -(-array.nbytes // ALIGNMENT) * ALIGNMENT
+	header = json.dumps({"source": fingerprint, "strings": strings, "arrays": layout}).encode()
+	header += b" " * (-(len(MAGIC) + 12 + len(header)) % ALIGNMENT)
+
+	temporary = f"{target}.{os.getpid()}.tmp"
+	with open(temporary, "wb") as f:
+		f.write(MAGIC + struct.pack("<IQ", VERSION, len(header)) + header)
+		for name, array in arrays.items():
+			data = array.astype(array.dtype.newbyteorder("<")).tobytes()
+			f.write(data + b"\0" * (-len(data) % ALIGNMENT))
+	os.replace(temporary, target)
+	return target
+
+
+# Memory map a compiled map. Returns (header, arrays), the arrays are read-only memoryviews
+# on the file (numpy.asarray gives zero-copy arrays from them). Reading a compiled map does
+# not import numpy, which is only needed to compile one.
+def load_compiled(filename):
+	with open(filename, "rb") as f:
+		data = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+	if bytes(data[:len(MAGIC)]) != MAGIC:
+		raise MapError(f"{filename}: not a compiled map")
+	version, header_length = struct.unpack("<IQ", data[len(MAGIC):len(MAGIC) + 12])
+	if version != VERSION:
+		raise MapError(f"{filename}: unsupported compiled map version {version}")
+	start = len(MAGIC) + 12
+	header = json.loads(bytes(data[start:start + header_length]))
+
+	base = start + header_length
+	arrays = {}
+	for name, (offset, dtype, shape) in header["arrays"].items():
+		count = 1
+		for dimension in shape:
+			count *= dimension
+		begin = base + offset
+		array = data[begin:begin + count * struct.calcsize(FORMATS[dtype])]
+		if sys.byteorder != "little":
+			import numpy as np
+			arrays[name] = np.frombuffer(array, dtype=dtype).astype(np.dtype(dtype).newbyteorder("=")).reshape(shape)
+		elif count == 0:
+			arrays[name] = array.cast(FORMATS[dtype])
+		else:
+			arrays[name] = array.cast(FORMATS[dtype], shape)
+	return header, arrays
+
+
+# Compiled form of a text map, recompiled only when the source changed
+def load_map(source):
+	target = source + ".qmap"
+	try:
+		header, arrays = load_compiled(target)
+		cached = header["source"]
+		stat = os.stat(source)
+		if cached["size"] == stat.st_size and cached["mtime_ns"] == stat.st_mtime_ns:
+			return header, arrays
+		if cached["sha256"] == source_fingerprint(source)["sha256"]:
+			return header, arrays
+	except (OSError, ValueError, KeyError):
+		pass
+
+	try:
+		return load_compiled(compile_map(source, target))
+	except OSError:		# Read-only location: compile in memory
+		arrays, strings = build_arrays(*parse_map(source))
+		return {"source": source_fingerprint(source), "strings": strings}, arrays
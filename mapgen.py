@@ -0,0 +1,97 @@
+import argparse
+import numpy as np
+from gates import CONTROLLED_GATE_NAMES, SINGLE_GATE_NAMES
+
+# Neighbour cells considered for the borders of a country on the generation grid
+GRID_NEIGHBOURS = [(0, 1), (1, 0), (1, 1), (1, -1)]
+
+# Shapes of the degree distribution: extra borders picked uniformly, or weighted by a
+# heavy tailed (Pareto) weight of both countries so that a few hub countries stand out
+DEGREE_DISTRIBUTIONS = ["uniform", "powerlaw"]
+
+
+# Generate a random map in the text format read by graph.load_world.
+#
+# Countries are placed on a jittered grid covering the map, continents are the Voronoi
+# regions of random seeds on that grid, and borders are drawn between neighbouring grid
+# cells: a snake path through the grid keeps the map connected, then random extra
+# borders are added until the average degree reaches mean_degree (at most 8), spread
+# according to degree_distribution. Borders only join neighbouring cells, so the degree of
+# a country stays at most 8 whatever the distribution.
+# qubits is either a fixed amount of qubits per country or a (min, max) range.
+def generate_map(filename, countries=1000, continents=10, mean_degree=3.0, qubits=1, seed=None,
+				 degree_distribution="uniform"):
+	if countries < 2 or continents < 1 or continents > countries:
+		raise ValueError("A map needs at least 2 countries and between 1 and countries continents")
+	if degree_distribution not in DEGREE_DISTRIBUTIONS:
+		raise ValueError(f"Unknown degree distribution '{degree_distribution}'")
+	rng = np.random.default_rng(seed)
+
+	columns = int(np.ceil(np.sqrt(countries * 4 / 3)))
+	rows = int(np.ceil(countries / columns))
+	cells = np.arange(countries)
+	row, column = cells // columns, cells % columns
+	column = np.where(row % 2 == 0, column, columns - 1 - column)	# Snake order through the grid
+	x = (column + 0.5 + rng.uniform(-0.3, 0.3, countries)) / columns * 0.9 + 0.05
+	y = (row + 0.5 + rng.uniform(-0.3, 0.3, countries)) / rows * 0.65 + 0.05
+
+	seeds = rng.choice(countries, size=continents, replace=False)
+	distances = (x[:, None] - x[seeds][None, :]) ** 2 + (y[:, None] - y[seeds][None, :]) ** 2
+	continent_ids = np.argmin(distances, axis=1)
+	continent_ids[seeds] = np.arange(continents)	# Every continent keeps at least its seed
+
+	if isinstance(qubits, int):
+		qubit_amounts = np.full(countries, qubits)
+	else:
+		qubit_amounts = rng.integers(qubits[0], qubits[1] + 1, countries)
+
+	# Snake path edges, then candidate borders between neighbouring cells
+	cell_index = {(r, c): i for i, (r, c) in enumerate(zip(row.tolist(), column.tolist()))}
+	edges = [(i, i + 1) for i in range(countries - 1)]
+	path = set(edges)
+	candidates = []
+	for (r, c), i in cell_index.items():
+		for dr, dc in GRID_NEIGHBOURS:
+			j = cell_index.get((r + dr, c + dc))
+			if j is not None and (min(i, j), max(i, j)) not in path:
+				candidates.append((min(i, j), max(i, j)))
+	extra = min(len(candidates), int(max(0.0, min(mean_degree, 8.0) * countries / 2 - len(edges))))
+	if degree_distribution == "uniform":
+		chosen = rng.permutation(len(candidates))[:extra]
+	else:
+		weights = rng.pareto(1.5, countries) + 1.0
+		pairs = np.array(candidates, dtype=np.int64).reshape(-1, 2)
+		probabilities = weights[pairs[:, 0]] * weights[pairs[:, 1]]
+		chosen = rng.choice(len(candidates), size=extra, replace=False, p=probabilities / probabilities.sum())
+	for index in chosen:
+		edges.append(candidates[index])
+
+	# The bonus of a continent of several countries is the controlled form of its gate
+	continent_sizes = np.bincount(continent_ids, minlength=continents)
+	with open(filename, "w") as f:
+		for i in range(countries):
+			f.write(f"Country {i}, {qubit_amounts[i]}, Continent {continent_ids[i]}, {x[i]:.4f}, {y[i]:.4f}\n")
+		f.write("\nEDGES\n\n")
+		for a, b in edges:
+			f.write(f"Country {a}, Country {b}\n")
+		f.write("\nCONTINENTS\n\n")
+		for j in range(continents):
+			color = "#%06X" % rng.integers(0, 0xFFFFFF)
+			choices = SINGLE_GATE_NAMES if continent_sizes[j] < 2 else CONTROLLED_GATE_NAMES
+			f.write(f"Continent {j}, {choices[j % len(choices)]}, {color}, {x[seeds[j]]:.4f}, {y[seeds[j]]:.4f}\n")
+	return filename
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="Generate a random Quantum Risk map")
+	parser.add_argument("filename")
+	parser.add_argument("--countries", type=int, default=1000)
+	parser.add_argument("--continents", type=int, default=10)
+	parser.add_argument("--mean-degree", type=float, default=3.0)
+	parser.add_argument("--degree-distribution", choices=DEGREE_DISTRIBUTIONS, default="uniform")
+	parser.add_argument("--qubits", type=int, nargs="+", default=[1], help="qubits per country, or a min and max")
+	parser.add_argument("--seed", type=int, default=None)
+	args = parser.parse_args()
+	qubits = args.qubits[0] if len(args.qubits) == 1 else tuple(args.qubits[:2])
+	generate_map(args.filename, args.countries, args.continents, args.mean_degree, qubits, args.seed,
+				 args.degree_distribution)
@@ -0,0 +1,151 @@
+import functools
+import json
+import sys
+import time
+
+# Methods timed once the metrics are enabled, by (module, class). Nothing is wrapped while
+# the metrics are disabled, so the hooks cost nothing in a normal game. Only the modules
+# already imported are hooked, the others when they are (see install_hooks): enabling the
+# metrics never loads the backend or tkinter in a headless process.
+HOOKS = {
+    ("quantum", "GameCircuit"): ["apply_single_gate", "apply_double_gate", "apply_swap", "flush", "measure_many",
+                                 "bloch_vectors", "outcome_probabilities"],
+    ("engine", "GameState"): ["place", "swap", "measure", "legal_placements", "legal_swaps", "battle_odds"],
+    ("graph", "World"): ["are_connected", "get_connected_countries", "get_all_possessions",
+                         "get_all_continental_bonus", "set_owner"],
+    ("view", "WorldView"): ["render", "highlight"],
+    ("game", "GameInstance"): ["place_troops", "move_troops", "execute_move", "execute_troop_swap",
+                               "refresh_troop_strength", "on_hover", "start_ai", "wait_for_ai"],
+}
+
+# Gate applications, counted in the circuit part of the turn records, with the position of
+# their first qubit argument to follow the depth of the circuit
+GATE_HOOKS = {"quantum.GameCircuit.apply_single_gate": 2, "quantum.GameCircuit.apply_double_gate": 2,
+              "quantum.GameCircuit.apply_swap": 1}
+
+recorder = None
+
+
+# Count, total and percentiles of a list of durations, in seconds
+def summarize(durations):
+    durations = sorted(durations)
+    count = len(durations)
+    return {
+        "count": count,
+        "total": sum(durations),
+        "p50": durations[count // 2],
+        "p95": durations[min(count - 1, int(count * 0.95))],
+        "max": durations[-1],
+    }
+
+
+# Collects the durations of the hooked calls and writes one record per turn
+class MetricsRecorder:
+    def __init__(self, filename=None):
+        self.filename = filename
+        self.file = open(filename, "a") if filename is not None else None
+        self.timings = {}               # Hook name -> durations of the calls of the current turn
+        self.layers = {}                # Qubit -> layer of its last gate, since the metrics were enabled
+        self.turn_start = time.perf_counter()
+        self.records = []
+
+    def add(self, name, duration):
+        self.timings.setdefault(name, []).append(duration)
+
+    # A gate starts a layer after the last ones of its qubits
+    def add_gate(self, qubits):
+        layer = max(self.layers.get(qubit, 0) for qubit in qubits) + 1
+        for qubit in qubits:
+            self.layers[qubit] = layer
+
+    def finish_turn(self, state):
+        circuit = state.circuit
+        record = {
+            "turn": state.turn,
+            "player": state.current_player,
+            "wall": time.perf_counter() - self.turn_start,
+            "calls": {name: summarize(durations) for name, durations in self.timings.items()},
+            "circuit": {
+                "qubits": circuit.size,
+                "gates": sum(len(self.timings.get(name, ())) for name in GATE_HOOKS),
+                "depth": max(self.layers.values(), default=0),
+                "blocks": len(circuit.state.get_blocks()),
+                "largest_block": circuit.state.largest_block_size(),
+                "pending": len(circuit.pending),
+            },
+        }
+        self.records.append(record)
+        if self.file is not None:
+            self.file.write(json.dumps(record) + "\n")
+            self.file.flush()
+        self.timings = {}
+        self.turn_start = time.perf_counter()
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+def timed(name, function):
+    first_qubit = GATE_HOOKS.get(name)
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            recorder.add(name, time.perf_counter() - start)
+            if first_qubit is not None:
+                recorder.add_gate(args[first_qubit:])
+    wrapper.original = function
+    return wrapper
+
+
+# Classes of the hooked modules that are imported (and fully initialized) by now
+def loaded_hooks():
+    for (module, name), methods in HOOKS.items():
+        owner = getattr(sys.modules.get(module), name, None)
+        if owner is not None:
+            yield module, name, owner, methods
+
+
+# Wrap the hooked methods of the modules imported since the last call. Called when the
+# metrics are enabled, when the engine loads the backend and at the end of every turn.
+def install_hooks():
+    if recorder is None:
+        return
+    for module, name, owner, methods in loaded_hooks():
+        for method in methods:
+            if not hasattr(getattr(owner, method), "original"):
+                setattr(owner, method, timed(f"{module}.{name}.{method}", getattr(owner, method)))
+
+
+# Start recording, the records are appended to filename as JSON lines (and kept in recorder.records)
+def enable(filename=None):
+    global recorder
+    if recorder is not None:
+        return recorder
+    recorder = MetricsRecorder(filename)
+    install_hooks()
+    return recorder
+
+
+def disable():
+    global recorder
+    if recorder is None:
+        return
+    for _, _, owner, methods in loaded_hooks():
+        for method in methods:
+            if hasattr(getattr(owner, method), "original"):
+                setattr(owner, method, getattr(owner, method).original)
+    recorder.close()
+    recorder = None
+
+
+# Called by the engine at the end of every turn
+def turn_finished(state):
+    if recorder is not None:
+        install_hooks()
+        recorder.finish_turn(state)
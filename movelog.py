@@ -0,0 +1,120 @@
+import argparse
+import json
+import time
+
+from engine import GameState
+from graph import load_world
+from moves import PlacingMove
+
+
+class ReplayError(ValueError):
+    pass
+
+
+# Append-only move log, one JSON object per line.
+# A game starts with a "start" entry (map, seed, initial owners) written by start_game, then
+# holds one entry per action recorded by engine.GameState: "place", "swap", "end_phase",
+# "measure" (with its outcomes) and "rewind" (undo back to the checkpoint taken after
+# to_actions actions). A log file can hold any amount of games.
+class MoveLog:
+    def __init__(self, filename):
+        self.filename = filename
+        self.file = open(filename, "a")
+
+    def append(self, entry):
+        self.file.write(json.dumps(entry) + "\n")
+        self.file.flush()       # Every action is on disk even if the game crashes
+
+    def close(self):
+        self.file.close()
+
+    # Log the start of a game on the world, returns the state recording into this log
+    def start_game(self, world, map_filename, seed):
+        owners = {country.name: country.owner for country in world.get_all_countries()}
+        self.append({"action": "start", "map": map_filename, "seed": seed, "owners": owners})
+        return GameState(world, seed=seed, log=self)
+
+
+# Games of a log file, as lists of entries each starting with its "start" entry
+def read_games(filename):
+    games = []
+    with open(filename, "r") as f:
+        for number, line in enumerate(f, start=1):
+            if len(line.strip()) == 0:
+                continue
+            entry = json.loads(line)
+            if entry["action"] == "start":
+                games.append([])
+            elif len(games) == 0:
+                raise ReplayError(f"{filename}:{number}: actions before the start of a game")
+            games[-1].append(entry)
+    return games
+
+
+# Play a logged game again without any UI, returns the final GameState.
+# Raises ReplayError when an action is illegal or a measurement gives another outcome
+# than the logged one, i.e. when the rules or the simulator changed since the game.
+def replay(entries, worlds=None):
+    start = entries[0]
+    if worlds is None:
+        worlds = {}
+    if start["map"] not in worlds:
+        worlds[start["map"]] = load_world(start["map"])
+    world = worlds[start["map"]]
+    for name, owner in start["owners"].items():
+        world.set_owner(name, owner)
+    state = GameState(world, seed=start["seed"])
+    state.enable_checkpoints()
+
+    for index, entry in enumerate(entries[1:], start=1):
+        if entry["player"] != state.current_player or entry["turn"] != state.turn:
+            raise ReplayError(f"action {index}: logged for player {entry['player']} turn {entry['turn']}, "
+                              f"replayed for player {state.current_player} turn {state.turn}")
+        action = entry["action"]
+        try:
+            if action == "place":
+                move = PlacingMove(entry["gate"])
+                move.country1, move.country2 = entry["country1"], entry["country2"]
+                move.qubit1, move.qubit2 = entry["qubit1"], entry["qubit2"]
+                state.place(move)
+            elif action == "swap":
+                state.swap(entry["country1"], entry["country2"], entry["qubit1"], entry["qubit2"])
+            elif action == "measure":
+                outcomes = state.measure([tuple(m) for m in entry["measurements"]])
+                if outcomes != entry["outcomes"]:
+                    raise ReplayError(f"action {index}: measured {outcomes}, logged {entry['outcomes']}")
+            elif action == "end_phase":
+                state.end_phase()
+            elif action == "rewind":
+                position = next((i for i, c in enumerate(state.checkpoints) if c.actions == entry["to_actions"]), None)
+                if position is None:
+                    raise ReplayError(f"action {index}: no checkpoint after action {entry['to_actions']}")
+                state.rewind(position)
+            else:
+                raise ReplayError(f"action {index}: unknown action '{action}'")
+        except ReplayError:
+            raise
+        except ValueError as error:
+            raise ReplayError(f"action {index}: {error}")
+    return state
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay logged games without the UI")
+    parser.add_argument("logs", nargs="+")
+    args = parser.parse_args()
+
+    worlds = {}
+    games = actions = failures = 0
+    start = time.perf_counter()
+    for filename in args.logs:
+        for number, entries in enumerate(read_games(filename), start=1):
+            games += 1
+            actions += len(entries) - 1
+            try:
+                replay(entries, worlds)
+            except ReplayError as error:
+                failures += 1
+                print(f"[WARNING] {filename} game {number}: {error}")
+    elapsed = time.perf_counter() - start
+    print(f"{games} games, {actions} actions replayed in {elapsed:.2f}s, {failures} diverged")
@@ -1,5 +1,3 @@
-import uuid
-
 class PlacingMove:
 	def __init__(self, gate):
 		self.gate = gate
@@ -8,24 +6,42 @@ class PlacingMove:
 		self.country2 = ""
 		self.qubit1 = 0
 		self.qubit2 = 0
+		self.items = None		# Canvas items of the move button, once rendered
+		self.drawn = None		# (x, y, selected) of the rendered button
 
-	def render(self, world, x, y, click_callback):
-		label = f"move-{str(uuid.uuid4())}"
+	# Draw the move button, its canvas items are created once and then only moved
+	def render(self, view, x, y, click_callback):
 		size = 18 if self.selected else 15
 		width = 3 if self.selected else 2
-		color = "orange" if self.is_double_gate() else "black"
-		world.canvas.create_rectangle(x - size, y - size, x + size, y + size, outline=color, fill="white", tags=("move", label), width=width)
-		world.canvas.create_text(x, y, text=f"{self.gate}", font=("Helvetica", 10, "bold"), fill=color, tags=("move", label + "-text"))
-		world.canvas.tag_bind(label, "<Button-1>", lambda e: click_callback(self))
-		world.canvas.tag_bind(label + "-text", "<Button-1>", lambda e: click_callback(self))
-		if self.country1 != "":
-			x1, y1 = world.get_country(self.country1).get_pos(world.size)
-			if world.selection not in ["", self.country1]:
-				x2, y2 = world.get_selected_country().get_pos(world.size)
-				world.canvas.create_oval(x2 - 5, y2 - 5, x2 + 5, y2 + 5, fill="green", tags="move")
-				world.canvas.create_line(x2, y2, x1, y1, fill="green", tags="move", width=5, arrow="last", arrowshape=(20, 20, 10))
-			else:
-				world.canvas.create_oval(x1 - 5, y1 - 5, x1 + 5, y1 + 5, fill="green", tags="move")
+		state = (x, y, self.selected)
+		if self.items is None:
+			color = "orange" if self.is_double_gate() else "black"
+			rectangle = view.canvas.create_rectangle(x - size, y - size, x + size, y + size, outline=color, fill="white", tags="move", width=width)
+			text = view.canvas.create_text(x, y, text=f"{self.gate}", font=("Helvetica", 10, "bold"), fill=color, tags="move")
+			self.items = (rectangle, text)
+			for item in self.items:
+				view.bind_click(item, lambda: click_callback(self))
+		elif self.drawn != state:
+			rectangle, text = self.items
+			view.canvas.coords(rectangle, x - size, y - size, x + size, y + size)
+			view.canvas.itemconfig(rectangle, width=width)
+			view.canvas.coords(text, x, y)
+		self.drawn = state
+
+	def clear(self, view):
+		if self.items is not None:
+			for item in self.items:
+				view.delete_item(item)
+			self.items = None
+			self.drawn = None
+
+	def render_pointer(self, view):
+		if self.country1 == "":
+			view.hide_pointer()
+		elif view.selection not in ["", self.country1]:
+			view.show_pointer(view.world.get_country(self.country1), view.get_selected_country())
+		else:
+			view.show_pointer(view.world.get_country(self.country1))
 
 	def is_double_gate(self):
 		return self.gate in ["CX", "CY", "CZ", "CXY", "CYZ", "CXZ"]
@@ -72,26 +88,28 @@ class TroopSwap:
 		self.qubit1 = 0
 		self.qubit2 = 0
 
-	def select_country(self, world, country):
+	def select_country(self, view, country):
 		if self.country1 == "":
 			self.country1 = country
 			return False
-		if world.are_connected(self.country1, country):
+		if view.world.are_connected(self.country1, country):
 			self.country2 = country
 			return True
-		world.show_temporary_message("Select a connected country", "red", 2000)
+		view.show_temporary_message("Select a connected country", "red", 2000)
 		return False
 
-	def render(self, world):
-		world.canvas.delete("swap")
-		if self.country1 != "":
-			x1, y1 = world.get_country(self.country1).get_pos(world.size)
-			if world.selection not in ["", self.country1]:
-				x2, y2 = world.get_selected_country().get_pos(world.size)
-				color = "green" if world.are_connected(self.country1, world.selection) else "red"
-				world.canvas.create_line(x2, y2, x1, y1, fill=color, tags="swap", width=5, arrow="both", arrowshape=(20, 20, 10))
-			else:
-				world.canvas.create_oval(x1 - 5, y1 - 5, x1 + 5, y1 + 5, fill="green", tags="swap")
+	def render(self, view):
+		if self.country1 == "":
+			view.hide_pointer()
+			view.highlight(())
+			return
+		view.highlight(view.world.get_connected_countries(self.country1))
+		country1 = view.world.get_country(self.country1)
+		if view.selection not in ["", self.country1]:
+			color = "green" if view.world.are_connected(self.country1, view.selection) else "red"
+			view.show_pointer(country1, view.get_selected_country(), color, arrow="both")
+		else:
+			view.show_pointer(country1)
 
 	def __str__(self):
 		return f"Swap: {self.country2}({self.qubit2}) <-> {self.country1}({self.qubit1})"
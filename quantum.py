@@ -1,123 +1,262 @@
-from qiskit import QuantumCircuit, transpile
-from qiskit_aer import AerSimulator
+from simulator import StateSimulator
+from stabilizer import StabilizerBlock
 import numpy as np
 
 PI_OVER_8 = np.pi / 8
 PI_OVER_4 = np.pi / 4
 
+I2 = np.eye(2, dtype=complex)
+PAULI_X = np.array([[0, 1], [1, 0]], dtype=complex)
+PAULI_Y = np.array([[0, -1j], [1j, 0]], dtype=complex)
+PAULI_Z = np.array([[1, 0], [0, -1]], dtype=complex)
+HADAMARD = np.array([[1, 1], [1, -1]], dtype=complex) / np.sqrt(2)
+S_GATE = np.array([[1, 0], [0, 1j]], dtype=complex)
+SDG_GATE = np.array([[1, 0], [0, -1j]], dtype=complex)
+
+
+def rx(theta):
+    return np.cos(theta / 2) * I2 - 1j * np.sin(theta / 2) * PAULI_X
+
+def ry(theta):
+    return np.cos(theta / 2) * I2 - 1j * np.sin(theta / 2) * PAULI_Y
+
+def rz(theta):
+    return np.cos(theta / 2) * I2 - 1j * np.sin(theta / 2) * PAULI_Z
+
+# 4x4 controlled version of a single qubit gate, control being the first qubit
+def controlled(matrix):
+    result = np.eye(4, dtype=complex)
+    result[2:, 2:] = matrix
+    return result
+
+
+# Precomputed unitary of every game gate.
+# The composite gates are the product of their three rotations (applied right to left).
+SINGLE_GATES = {
+    'X': rx(PI_OVER_8),
+    'Y': ry(PI_OVER_8),
+    'Z': rz(PI_OVER_8),
+    'XY': rz(-PI_OVER_4) @ rx(PI_OVER_8) @ rz(PI_OVER_4),
+    'YZ': rx(-PI_OVER_4) @ ry(PI_OVER_8) @ rx(PI_OVER_4),
+    'XZ': ry(-PI_OVER_4) @ rz(PI_OVER_8) @ ry(PI_OVER_4),
+    'H': HADAMARD,
+}
+
+DOUBLE_GATES = {
+    'CX': controlled(PAULI_X),
+    'CY': controlled(PAULI_Y),
+    'CZ': controlled(PAULI_Z),
+    'CXY': controlled(SINGLE_GATES['XY']),
+    'CYZ': controlled(SINGLE_GATES['YZ']),
+    'CXZ': controlled(SINGLE_GATES['XZ']),
+}
+
+# Gates rotating a basis to the Z basis before a measurement, and back after it
+BASIS_GATES = {
+    'TO_Z_X': HADAMARD, 'TO_Z_Y': HADAMARD @ SDG_GATE, 'TO_Z_Z': I2,
+    'FROM_Z_X': HADAMARD, 'FROM_Z_Y': S_GATE @ HADAMARD, 'FROM_Z_Z': I2,
+}
+
+SEGMENT_GATES = {**SINGLE_GATES, **BASIS_GATES}
+
+
 class GameCircuit:
-    def __init__(self, qubits):
+    def __init__(self, qubits, seed=None):
         self.size = qubits
-        self.qc = QuantumCircuit(qubits, qubits)
+        self.state = StateSimulator(qubits, seed)   # Long-lived backend holding the current state
+        self.pending = {}   # Fused 2x2 unitary of the single qubit gates not yet sent to the simulator
+        self.bloch = None   # Cached Bloch vectors, reset whenever a gate is applied
+        self.outcomes = {}  # Cached outcome distributions by query, reset whenever a gate is applied
+
+    # Drop the values cached for the previous state
+    def invalidate(self):
+        self.bloch = None
+        self.outcomes = {}
+
+    # References to the current state, the blocks are shared since they are never modified
+    def checkpoint(self):
+        return {"blocks": tuple(self.state.block_of), "pending": dict(self.pending),
+                "rng": self.state.rng.bit_generator.state}
+
+    def restore(self, checkpoint):
+        self.state.block_of = list(checkpoint["blocks"])
+        self.pending = dict(checkpoint["pending"])
+        self.state.rng.bit_generator.state = checkpoint["rng"]
+        self.invalidate()
+
+    # Fuse a gate into the pending unitary of the qubit, so a query costs the same at any game length.
+    # The fused matrices are never modified, checkpoints share them.
+    def _queue(self, gate, qubit):
+        matrix = SEGMENT_GATES[gate] @ self.pending[qubit] if qubit in self.pending else SEGMENT_GATES[gate].copy()
+        matrix.setflags(write=False)
+        self.pending[qubit] = matrix
+        self.invalidate()
+
+    # Send the pending unitaries of the given qubits to the simulator
+    def flush(self, qubits=None):
+        if qubits is None:
+            qubits = list(self.pending.keys())
+        for qubit in qubits:
+            matrix = self.pending.pop(qubit, None)
+            if matrix is not None:
+                self.state.apply(matrix, [qubit])
 
     def apply_single_gate(self, gate, qubit):
-        if qubit < 0 or qubit > self.size:
+        if qubit < 0 or qubit >= self.size:
             print(f"[WARNING] Qubit index {qubit} out of range [0, {self.size-1}]")
             return
         gate = gate.upper()
 
-        if gate == 'X':
-            self.qc.rx(PI_OVER_8, qubit)
-        elif gate == 'Y':
-            self.qc.ry(PI_OVER_8, qubit)
-        elif gate == 'Z':
-            self.qc.rz(PI_OVER_8, qubit)
-            pass
-        elif gate == 'XY':
-            self.qc.rz(PI_OVER_4, qubit)
-            self.qc.rx(PI_OVER_8, qubit)
-            self.qc.rz(-PI_OVER_4, qubit)
-            pass
-        elif gate == 'YZ':
-            self.qc.rx(PI_OVER_4, qubit)
-            self.qc.ry(PI_OVER_8, qubit)
-            self.qc.rx(-PI_OVER_4, qubit)
-            pass
-        elif gate == 'XZ':
-            self.qc.ry(PI_OVER_4, qubit)
-            self.qc.rz(PI_OVER_8, qubit)
-            self.qc.ry(-PI_OVER_4, qubit)
-            pass
-        elif gate == 'H':
-            self.qc.h(qubit)
-        else:
+        if gate not in SINGLE_GATES:
             print(f"[WARNING] Invalid gate: {gate}")
+            return
+        self._queue(gate, qubit)
 
     def apply_double_gate(self, gate, control, target):
-        if control < 0 or control > self.size:
+        if control < 0 or control >= self.size:
             print(f"[WARNING] Control qubit index {control} out of range [0, {self.size-1}]")
             return
-        if target < 0 or target > self.size:
+        if target < 0 or target >= self.size:
             print(f"[WARNING] Target qubit index {target} out of range [0, {self.size-1}]")
             return
         gate = gate.upper()
 
-        if gate == 'CX':
-            self.qc.cx(control, target)
-        elif gate == 'CY':
-            self.qc.cy(control, target)
-        elif gate == 'CZ':
-            self.qc.cz(control, target)
-        elif gate == 'CXY':
-            self.qc.crz(PI_OVER_4, control, target)
-            self.qc.crx(PI_OVER_8, control, target)
-            self.qc.crz(-PI_OVER_4, control, target)
-            pass
-        elif gate == 'CYZ':
-            self.qc.crx(PI_OVER_4, control, target)
-            self.qc.cry(PI_OVER_8, control, target)
-            self.qc.crx(-PI_OVER_4, control, target)
-            pass
-        elif gate == 'CXZ':
-            self.qc.cry(PI_OVER_4, control, target)
-            self.qc.crz(PI_OVER_8, control, target)
-            self.qc.cry(-PI_OVER_4, control, target)
-            pass
-        else:
+        if gate not in DOUBLE_GATES:
             print(f"[WARNING] Invalid gate: {gate}")
+            return
+        # The pending single qubit gates are fused into the 4x4 unitary
+        matrix = DOUBLE_GATES[gate] @ np.kron(self.pending.pop(control, I2), self.pending.pop(target, I2))
+        self.state.apply(matrix, [control, target])
+        self.invalidate()
 
 
     def apply_swap(self, qubit1, qubit2):
-        self.qc.swap(qubit1, qubit2)
+        pending1 = self.pending.pop(qubit1, None)
+        pending2 = self.pending.pop(qubit2, None)
+        if pending1 is not None:
+            self.pending[qubit2] = pending1
+        if pending2 is not None:
+            self.pending[qubit1] = pending2
+        self.state.swap(qubit1, qubit2)
+        self.invalidate()
 
 
     def measure_in_basis(self, qubit_index, basis):
-        # Apply basis-changing gates
-        if basis == 'X':
-            self.qc.h(qubit_index)  # Rotate to Z basis
-        elif basis == 'Y':
-            self.qc.sdg(qubit_index)  # Rotate to X basis
-            self.qc.h(qubit_index)  # Rotate to Z basis
-        elif basis != 'Z':
-            raise ValueError("Basis must be 'X', 'Y', or 'Z'")
-
-        # Add a classical bit for measurement
-        self.qc.add_register(1)
-        classical_bit = self.qc.num_clbits - 1  # Last classical bit in the circuit
+        return self.measure_many([(qubit_index, basis)])[0]
 
-        # Measure the qubit
-        self.qc.measure(qubit_index, classical_bit)
+    # Measure several (qubit, basis) pairs jointly in one simulator execution.
+    # Returns the +1/-1 observables in the given order, the bases are restored afterwards.
+    def measure_many(self, measurements):
+        self._check_measurements(measurements)
+        qubits = [qubit for qubit, _ in measurements]
 
-        # Execute the circuit using the Aer simulator
-        simulator = AerSimulator()
-        self.qc = transpile(self.qc, simulator)
+        # Rotate to the Z basis, fused with the pending gates of each qubit
+        for qubit, basis in measurements:
+            self._queue(f"TO_Z_{basis}", qubit)
+        self.flush(qubits)
 
-        # Run and get counts
-        result = simulator.run(self.qc, shots=1).result()
-        counts = result.get_counts(self.qc)
+        # Sample all the qubits from the same state and collapse it ('0' or '1')
+        results = self.state.measure_many(qubits)
 
-        # Get the measurement result
-        measurement_result = int(list(counts.keys())[0])  # '0' or '1'
+        # Move the state back to the measured bases, applied lazily with the next gates
+        for qubit, basis in measurements:
+            self._queue(f"FROM_Z_{basis}", qubit)
 
         # Convert to +1 or -1
-        observable = measurement_result * 2 - 1
+        return [result * 2 - 1 for result in results]
+
+    def _check_measurements(self, measurements):
+        for qubit, basis in measurements:
+            if basis not in ('X', 'Y', 'Z'):
+                raise ValueError("Basis must be 'X', 'Y', or 'Z'")
+            if qubit < 0 or qubit >= self.size:
+                raise ValueError(f"Qubit index {qubit} out of range [0, {self.size-1}]")
+        if len(set(qubit for qubit, _ in measurements)) != len(measurements):
+            raise ValueError("Measured qubits must be distinct")
+
+    # Exact joint distribution of the outcomes of measuring the (qubit, basis) pairs, computed
+    # from the state without collapsing it. Returns a read-only array of shape (2,) * k where
+    # index 1 of an axis is the +1 outcome. Cached by query until the next gate.
+    def outcome_probabilities(self, measurements):
+        key = tuple(measurements)
+        if key in self.outcomes:
+            return self.outcomes[key]
+        self._check_measurements(measurements)
+
+        # Blocks are independent: the distribution is the product of their marginals
+        groups = {}
+        for position, (qubit, _) in enumerate(measurements):
+            groups.setdefault(id(self.state.block_of[qubit]), []).append(position)
+        probabilities = np.ones(())
+        order = []
+        for positions in groups.values():
+            block = self.state.block_of[measurements[positions[0]][0]]
+            rotations = [BASIS_GATES[f"TO_Z_{basis}"] @ self.pending.get(qubit, I2)
+                         for qubit, basis in (measurements[p] for p in positions)]
+            if isinstance(block, StabilizerBlock):
+                marginal = self._stabilizer_marginal(block, [measurements[p][0] for p in positions], rotations)
+            else:
+                tensor = block.tensor
+                axes = []
+                for position, rotation in zip(positions, rotations):
+                    axis = block.axis(measurements[position][0])
+                    tensor = np.moveaxis(np.tensordot(rotation, tensor, axes=(1, axis)), 0, axis)
+                    axes.append(axis)
+                others = tuple(a for a in range(len(block)) if a not in axes)
+                marginal = np.sum(np.abs(tensor) ** 2, axis=others)
+                sorted_axes = sorted(axes)
+                marginal = np.transpose(marginal, [sorted_axes.index(a) for a in axes])
+            probabilities = np.multiply.outer(probabilities, marginal)
+            order.extend(positions)
+
+        probabilities = np.transpose(probabilities, np.argsort(order))
+        probabilities = probabilities / probabilities.sum()
+        probabilities.setflags(write=False)
+        self.outcomes[key] = probabilities
+        return probabilities
+
+    # Marginal of qubits of a tableau, from their reduced density matrix rotated to the Z basis
+    @staticmethod
+    def _stabilizer_marginal(block, qubits, rotations):
+        rho = block.reduced_density_matrix(qubits)
+        rotation = np.ones((1, 1))
+        for matrix in rotations:
+            rotation = np.kron(rotation, matrix)
+        diagonal = np.einsum('ij,jk,ik->i', rotation, rho, rotation.conj()).real
+        return diagonal.reshape((2,) * len(qubits))
+
+    # Sample many shots of the (qubit, basis) measurements in one batched draw from the exact
+    # distribution. Returns the +1/-1 observables as an array of shape (shots, k). The state
+    # is not collapsed and its random generator is not used, unless given as rng.
+    def sample_outcomes(self, measurements, shots, rng=None):
+        if rng is None:
+            rng = np.random.default_rng()
+        probabilities = self.outcome_probabilities(measurements).reshape(-1)
+        samples = rng.choice(len(probabilities), size=shots, p=probabilities)
+        bits = (samples[:, None] >> np.arange(len(measurements) - 1, -1, -1)) & 1
+        return bits * 2 - 1
+
+    # Exact <X>, <Y>, <Z> of every qubit, as an array of shape (size, 3).
+    # Computed without sampling nor collapsing the state, and cached until the next gate.
+    def bloch_vectors(self):
+        if self.bloch is not None:
+            return self.bloch
+
+        rho = self.state.reduced_density_matrices()
+        if len(self.pending) > 0:
+            qubits = list(self.pending.keys())
+            unitaries = np.array([self.pending[q] for q in qubits])
+            rho[qubits] = unitaries @ rho[qubits] @ unitaries.conj().transpose(0, 2, 1)
 
-        # Move the state back to the corresponding basis
-        # Apply basis-changing gates
-        if basis == 'X':
-            self.qc.h(qubit_index)  # Rotate to X basis
-        elif basis == 'Y':
-            self.qc.h(qubit_index)  # Rotate to X basis
-            self.qc.s(qubit_index)  # Rotate to Y basis
+        bloch = np.empty((self.size, 3))
+        bloch[:, 0] = 2 * rho[:, 0, 1].real
+        bloch[:, 1] = -2 * rho[:, 0, 1].imag
+        bloch[:, 2] = (rho[:, 0, 0] - rho[:, 1, 1]).real
+        bloch.setflags(write=False)
+        self.bloch = bloch
+        return bloch
 
-        return observable
\ No newline at end of file
+    # Bloch vectors of the qubits of each country, as a dict {name: array of shape (qubits, 3)}
+    def country_bloch_vectors(self, countries):
+        bloch = self.bloch_vectors()
+        return {country.name: bloch[country.qubits] for country in countries}
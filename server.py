@@ -0,0 +1,216 @@
+import argparse
+import asyncio
+import importlib
+import json
+import multiprocessing
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+
+from engine import PHASE_MOVING, GameState
+from graph import load_world
+from moves import PlacingMove
+
+DEFAULT_PORT = 7878
+DEFAULT_MAP = os.path.join(os.path.dirname(os.path.abspath(__file__)), "risk_graph.txt")
+
+SESSIONS = {}       # GameState of every session hosted by a worker process, by session id
+
+
+class SessionError(ValueError):
+    pass
+
+
+# State of a session as sent to the clients. The full view adds the owners and the troop
+# strengths, which need the Bloch vectors of the whole circuit.
+def session_view(state, full=False):
+    view = {"player": state.current_player, "phase": state.phase, "turn": state.turn,
+            "moves": [move.gate for move in state.current_moves]}
+    if state.phase == PHASE_MOVING:
+        view["swaps"] = state.legal_swaps()
+    if full:
+        countries = state.world.get_all_countries()
+        bloch = state.circuit.country_bloch_vectors(countries)
+        view["owners"] = {country.name: country.owner for country in countries}
+        view["strength"] = {name: -float(vectors[:, 2].mean()) for name, vectors in bloch.items()}
+    return view
+
+
+# Worker process: play one request on one of its sessions, returns the fields of the response.
+# Every session lives in a single worker, so its requests never move any quantum state.
+def handle(session, request):
+    op = request["op"]
+    if op == "new":
+        seed = request.get("seed")
+        if seed is None:
+            seed = random.randrange(2 ** 32)
+        world = load_world(request["map"])
+        world.initialize_balanced_ownership(1, random.Random(seed))
+        SESSIONS[session] = GameState(world, seed=seed)
+        SESSIONS[session].enable_checkpoints()
+        return {"seed": seed, **session_view(SESSIONS[session], full=True)}
+    if session not in SESSIONS:
+        raise SessionError(f"unknown session {session}")
+    state = SESSIONS[session]
+
+    if op == "state":
+        return session_view(state, full=True)
+    if op == "place":
+        move = PlacingMove(request["gate"])
+        move.country1, move.country2 = request["country1"], request.get("country2", "")
+        move.qubit1, move.qubit2 = request.get("qubit1", 0), request.get("qubit2", 0)
+        state.place(move)
+    elif op == "swap":
+        state.swap(request["country1"], request["country2"], request.get("qubit1", 0), request.get("qubit2", 0))
+    elif op == "end_phase":
+        state.end_phase()
+    elif op == "undo":
+        if not state.undo(request.get("players")):
+            raise SessionError("nothing to undo")
+    elif op == "measure":
+        return {"outcomes": state.measure([tuple(m) for m in request["measurements"]]), **session_view(state)}
+    elif op == "odds":
+        return {"odds": state.battle_odds(request["attacker"], request["defender"],
+                                          request.get("attack_basis", "Z"), request.get("defense_basis", "Z"))}
+    elif op == "close":
+        del SESSIONS[session]
+        return {}
+    else:
+        raise SessionError(f"unknown op '{op}'")
+    return session_view(state)
+
+
+# Asyncio server hosting many concurrent game sessions over line-delimited JSON.
+# A request is one JSON object per line: {"op": ..., "session": ..., "id": ...} plus the fields
+# of the op, the response echoes the id with "ok" and either the result or an "error":
+#   new      (map, seed)                        -> session, seed, full view
+#            map is the file name of one of the maps served, the first one by default
+#   state                                       -> full view
+#   place    gate, country1 (country2, qubit1, qubit2)
+#   swap     country1, country2 (qubit1, qubit2)
+#   end_phase, undo (players)                   -> view
+#   measure  measurements: [[country, qubit, basis], ...]   -> outcomes, view
+#   odds     attacker, defender (attack_basis, defense_basis)   -> [win, draw, loss]
+#   close, info                                 -> worker and session counts
+# The simulator work runs in a fixed pool of worker processes (one per core by default), so a
+# slow measurement only delays the sessions of its worker and the event loop keeps serving
+# the others. Sessions are spread over the workers by load and closed with their connection.
+class GameServer:
+    def __init__(self, workers=None, maps=None):
+        self.workers = workers or os.cpu_count() or 1
+        # Only the maps given here can be played: clients name them, they never give a path
+        self.maps = {os.path.basename(path): path for path in (maps or [DEFAULT_MAP])}
+        # Single process executors: requests of a worker run in order, on the sessions it holds.
+        # Workers are spawned, not forked, so that they never inherit the sockets of the clients.
+        context = multiprocessing.get_context("spawn")
+        self.pools = [ProcessPoolExecutor(max_workers=1, mp_context=context, initializer=importlib.import_module,
+                                          initargs=("quantum",)) for _ in range(self.workers)]
+        self.load = [0] * self.workers      # Open sessions of each worker
+        self.worker_of = {}                 # Worker of each open session
+        self.next_session = 1
+        self.server = None
+
+    async def start(self, host="127.0.0.1", port=DEFAULT_PORT):
+        # The workers are started (and the backend imported) before the first client connects
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(pool, int) for pool in self.pools))
+        self.server = await asyncio.start_server(self.serve_client, host, port)
+        return self.server
+
+    def close(self):
+        if self.server is not None:
+            self.server.close()
+        for pool in self.pools:
+            pool.shutdown(cancel_futures=True)
+
+    async def serve_client(self, reader, writer):
+        opened = set()      # Sessions created by this connection
+        try:
+            while True:
+                line = await reader.readline()
+                if len(line) == 0:
+                    break
+                response = await self.respond(line, opened)
+                writer.write((json.dumps(response) + "\n").encode())
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+            for session in opened:
+                if self.server.is_serving():        # The workers are gone once the server is closed
+                    self.pools[self.worker_of[session]].submit(handle, session, {"op": "close"})
+                self.release(session)
+
+    async def respond(self, line, opened):
+        request = {}
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise SessionError("a request must be a JSON object")
+            op = request.get("op")
+            if op == "info":
+                result = {"workers": self.workers, "sessions": len(self.worker_of)}
+            elif op == "new":
+                session = self.next_session
+                self.next_session += 1
+                name = request.get("map", next(iter(self.maps)))
+                if name not in self.maps:
+                    raise SessionError(f"unknown map {name!r}, served maps: {', '.join(self.maps)}")
+                request = {**request, "map": self.maps[name]}
+                worker = self.load.index(min(self.load))
+                self.worker_of[session] = worker
+                self.load[worker] += 1
+                opened.add(session)
+                try:
+                    result = {"session": session, **await self.run(session, request)}
+                except Exception:
+                    opened.discard(session)
+                    self.release(session)
+                    raise
+            else:
+                session = request.get("session")
+                if session not in opened:
+                    raise SessionError(f"unknown session {session}")
+                result = await self.run(session, request)
+                if op == "close":
+                    opened.discard(session)
+                    self.release(session)
+            return {"id": request.get("id"), "ok": True, **result}
+        except (ValueError, KeyError, TypeError) as error:
+            message = f"missing or unknown {error}" if isinstance(error, KeyError) else str(error)
+            return {"id": request.get("id") if isinstance(request, dict) else None, "ok": False, "error": message}
+        except Exception as error:      # A bug must not drop the connection and its sessions
+            print(f"[WARNING] request {line[:200]!r} failed: {error!r}")
+            return {"id": request.get("id") if isinstance(request, dict) else None, "ok": False,
+                    "error": f"internal error ({type(error).__name__})"}
+
+    def run(self, session, request):
+        pool = self.pools[self.worker_of[session]]
+        return asyncio.get_running_loop().run_in_executor(pool, handle, session, request)
+
+    def release(self, session):
+        self.load[self.worker_of.pop(session)] -= 1
+
+
+async def serve(host, port, workers, maps):
+    server = GameServer(workers, maps)
+    try:
+        await server.start(host, port)
+        print(f"Serving on {host}:{port} with {server.workers} workers")
+        await server.server.serve_forever()
+    finally:
+        server.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Host Quantum Risk sessions over line-delimited JSON")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--maps", nargs="+", help="map files the clients can play, risk_graph.txt by default")
+    parser.add_argument("--workers", type=int, default=None, help="simulator worker processes, one per core by default")
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.host, args.port, args.workers, args.maps))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,231 @@
+import numpy as np
+from stabilizer import StabilizerBlock, clifford_table
+
+# Tolerance used to decide if a qubit can be factored out of its block
+SEPARABILITY_TOLERANCE = 1e-10
+
+
+# Group of qubits entangled together, stored as one small state tensor.
+# Axis i of the tensor corresponds to qubits[i].
+class Block:
+    def __init__(self, qubits, tensor):
+        self.qubits = tuple(qubits)
+        self.tensor = tensor
+
+    def axis(self, qubit):
+        return self.qubits.index(qubit)
+
+    def __len__(self):
+        return len(self.qubits)
+
+    def with_qubits(self, qubits):
+        return Block(qubits, self.tensor)
+
+    @property
+    def nbytes(self):
+        return self.tensor.nbytes
+
+
+# Dense form of a block
+def dense(block):
+    if isinstance(block, StabilizerBlock):
+        return Block(block.qubits, block.to_tensor())
+    return block
+
+
+# Stateful simulator keeping the current quantum state between calls.
+# Qubits are tracked in blocks (connected components of entangled qubits): each block is a
+# separate state tensor, blocks are merged only when a two-qubit gate crosses them and are
+# split again after measurement, so memory and time scale with the largest entangled cluster.
+#
+# Clifford gates between stabilizer states are simulated on a stabilizer tableau instead
+# (StabilizerBlock), polynomial in the size of the block: qubits entangled by H, CX, CY, CZ
+# and the measurement basis changes never need a dense tensor. A block is only made dense
+# when a non-Clifford gate (the pi/8 rotations) touches one of its qubits.
+class StateSimulator:
+    def __init__(self, qubits, seed=None):
+        self.size = qubits
+        self.rng = np.random.default_rng(seed)
+        self.block_of = [Block([q], np.array([1.0, 0.0], dtype=complex)) for q in range(qubits)]
+
+    def get_blocks(self):
+        blocks = {}
+        for block in self.block_of:
+            blocks[id(block)] = block
+        return list(blocks.values())
+
+    def largest_block_size(self):
+        return max((len(block) for block in self.block_of), default=0)
+
+    # Replace the whole state by the given blocks, which must cover every qubit once
+    def set_blocks(self, blocks):
+        qubits = sorted(q for block in blocks for q in block.qubits)
+        if qubits != list(range(self.size)):
+            raise ValueError("Blocks must cover every qubit exactly once")
+        for block in blocks:
+            if isinstance(block, Block) and block.tensor.shape != (2,) * len(block):
+                raise ValueError(f"Block of {len(block)} qubits has a tensor of shape {block.tensor.shape}")
+            self._set_block(block)
+
+    def _set_block(self, block):
+        for qubit in block.qubits:
+            self.block_of[qubit] = block
+
+    def _merge(self, block1, block2):
+        tensor = np.multiply.outer(block1.tensor, block2.tensor)
+        block = Block(block1.qubits + block2.qubits, tensor)
+        self._set_block(block)
+        return block
+
+    # Tableau of the blocks for a Clifford gate, None when the gate has to be applied densely:
+    # a dense block can only join a tableau if it is a single qubit in a stabilizer state,
+    # and single dense qubits stay dense unless the gate entangles them with other blocks
+    def _stabilizer_blocks(self, blocks, qubits):
+        if len(qubits) == 1 and not isinstance(blocks[0], StabilizerBlock):
+            return None
+        stabilizers = []
+        for block in blocks:
+            if not isinstance(block, StabilizerBlock):
+                if len(block) > 1:
+                    return None
+                block = StabilizerBlock.from_vector(block.qubits[0], block.tensor)
+                if block is None:
+                    return None
+            stabilizers.append(block)
+        return stabilizers
+
+    # Apply a 2^k x 2^k unitary on the given k qubits.
+    # The first qubit of the list is the most significant bit of the matrix index.
+    def apply(self, matrix, qubits):
+        blocks = list({id(self.block_of[q]): self.block_of[q] for q in qubits}.values())
+        table = clifford_table(matrix)
+        stabilizers = self._stabilizer_blocks(blocks, qubits) if table is not None else None
+        if stabilizers is not None:
+            block = stabilizers[0]
+            for other in stabilizers[1:]:
+                block = StabilizerBlock.merge(block, other)
+            self._set_block(block.apply(table, [block.axis(q) for q in qubits]))
+            return
+
+        block = dense(blocks[0])
+        for other in blocks[1:]:
+            block = self._merge(block, dense(other))
+
+        k = len(qubits)
+        axes = [block.axis(q) for q in qubits]
+        tensor = np.asarray(matrix).reshape((2,) * (2 * k))
+        result = np.tensordot(tensor, block.tensor, axes=(list(range(k, 2 * k)), axes))
+        self._set_block(Block(block.qubits, np.moveaxis(result, list(range(k)), axes)))
+
+    # A swap never creates entanglement, it only exchanges the labels of the two qubits
+    def swap(self, qubit1, qubit2):
+        if qubit1 == qubit2:
+            return
+        relabel = {qubit1: qubit2, qubit2: qubit1}
+        blocks = {id(self.block_of[qubit1]): self.block_of[qubit1], id(self.block_of[qubit2]): self.block_of[qubit2]}
+        for block in blocks.values():
+            self._set_block(block.with_qubits([relabel.get(q, q) for q in block.qubits]))
+
+    # Measure a qubit in the computational basis, collapse the state and return 0 or 1
+    def measure(self, qubit):
+        return self.measure_many([qubit])[0]
+
+    # Measure several qubits jointly in the computational basis.
+    # Qubits of a same block are sampled together from their joint distribution with one draw,
+    # the state is collapsed and the list of outcomes (0 or 1) is returned in the given order.
+    def measure_many(self, qubits):
+        if len(set(qubits)) != len(qubits):
+            raise ValueError("Measured qubits must be distinct")
+
+        groups = {}
+        for qubit in qubits:
+            groups.setdefault(id(self.block_of[qubit]), []).append(qubit)
+
+        outcomes = {}
+        for group in groups.values():
+            block = self.block_of[group[0]]
+            if isinstance(block, StabilizerBlock):
+                self._measure_stabilizer(block, group, outcomes)
+                continue
+            axes = [block.axis(q) for q in group]
+            others = tuple(a for a in range(len(block)) if a not in axes)
+
+            marginal = np.sum(np.abs(block.tensor) ** 2, axis=others)
+            sorted_axes = sorted(axes)
+            marginal = np.transpose(marginal, [sorted_axes.index(a) for a in axes]).reshape(-1)
+            marginal = marginal / marginal.sum()
+            sample = self.rng.choice(len(marginal), p=marginal)
+            bits = np.unravel_index(sample, (2,) * len(group))
+
+            index = [slice(None)] * len(block)
+            for qubit, axis, bit in zip(group, axes, bits):
+                index[axis] = int(bit)
+                outcomes[qubit] = int(bit)
+                measured = np.zeros(2, dtype=complex)
+                measured[bit] = 1.0
+                self._set_block(Block([qubit], measured))
+
+            if len(others) > 0:
+                rest = block.tensor[tuple(index)] / np.sqrt(marginal[sample])
+                self._split(Block([block.qubits[a] for a in others], rest))
+
+        return [outcomes[qubit] for qubit in qubits]
+
+    # Measure qubits of a tableau one after the other, each measured qubit leaves the tableau
+    def _measure_stabilizer(self, block, group, outcomes):
+        for qubit in group:
+            outcome, block = block.measure(qubit, self.rng)
+            outcomes[qubit] = outcome
+            measured = np.zeros(2, dtype=complex)
+            measured[outcome] = 1.0
+            self._set_block(Block([qubit], measured))
+        if len(block) == 1:
+            block = dense(block)
+        if len(block) > 0:
+            self._set_block(block)
+
+    # Factor out every qubit of the block which is no longer entangled with the others
+    def _split(self, block):
+        index = 0
+        while len(block) > 1 and index < len(block):
+            matrix = np.moveaxis(block.tensor, index, 0).reshape(2, -1)
+            rho = matrix @ matrix.conj().T
+            if abs(np.linalg.det(rho)) > SEPARABILITY_TOLERANCE:
+                index += 1
+                continue
+
+            # Pure reduced state: the qubit is in the dominant eigenvector of rho
+            _, vectors = np.linalg.eigh(rho)
+            single = vectors[:, 1]
+            rest = single.conj() @ matrix
+            rest = rest / np.linalg.norm(rest)
+            qubits = block.qubits[:index] + block.qubits[index + 1:]
+            shape = block.tensor.shape[:index] + block.tensor.shape[index + 1:]
+
+            self._set_block(Block([block.qubits[index]], single))
+            block = Block(qubits, rest.reshape(shape))
+        self._set_block(block)
+
+    # Reduced 2x2 density matrix of every qubit, as an array of shape (size, 2, 2)
+    def reduced_density_matrices(self):
+        result = np.empty((self.size, 2, 2), dtype=complex)
+        singles = []
+        for block in self.get_blocks():
+            if isinstance(block, StabilizerBlock):
+                x, y, z = block.bloch_vectors().T
+                result[list(block.qubits)] = np.stack([np.stack([1 + z, x - 1j * y], -1),
+                                                       np.stack([x + 1j * y, 1 - z], -1)], -2) / 2
+                continue
+            if len(block) == 1:
+                singles.append(block)
+                continue
+            for axis, qubit in enumerate(block.qubits):
+                matrix = np.moveaxis(block.tensor, axis, 0).reshape(2, -1)
+                result[qubit] = matrix @ matrix.conj().T
+
+        # Unentangled qubits are all handled in one vectorized operation
+        if len(singles) > 0:
+            vectors = np.array([block.tensor for block in singles])
+            qubits = [block.qubits[0] for block in singles]
+            result[qubits] = np.einsum('mi,mj->mij', vectors, vectors.conj())
+        return result
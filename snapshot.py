@@ -0,0 +1,97 @@
+import json
+import os
+import numpy as np
+
+from engine import GameState
+from moves import PlacingMove
+from quantum import GameCircuit
+from simulator import Block
+from stabilizer import StabilizerBlock
+
+SNAPSHOT_VERSION = 1
+
+
+# Snapshot of a game, stored as an npz archive (compressed by default):
+#  - countries, owners      owner of every country, in the order of the map
+#  - game                   snapshot version, current player, phase, turn
+#  - moves                  gates of the moves the current player has not placed yet
+#  - block_qubits, block_ptr   qubits of each block of the simulator, CSR style
+#  - amplitudes             state tensors of the blocks, flattened and concatenated
+#  - tableau_qubits, tableau_ptr   qubits of each stabilizer block, CSR style
+#  - tableau_x, tableau_z, tableau_r   their generators, flattened and concatenated
+#  - pending_qubits, pending   fused unitaries of the pending single qubit gates, shape (k, 2, 2)
+#  - rng                    state of the measurement random generator, as JSON
+# Only the entangled blocks are stored, not the full 2^n state vector. The pending gates are
+# stored as they are, so saving a snapshot never changes the game.
+def save_snapshot(state, filename, compress=True):
+    circuit = state.circuit
+    blocks = [block for block in circuit.state.get_blocks() if isinstance(block, Block)]
+    tableaux = [block for block in circuit.state.get_blocks() if isinstance(block, StabilizerBlock)]
+    countries = state.world.get_all_countries()
+    arrays = {
+        "countries": np.array([country.name for country in countries], dtype=str),
+        "owners": np.array([country.owner for country in countries], dtype=np.int8),
+        "game": np.array([SNAPSHOT_VERSION, state.current_player, state.phase, state.turn], dtype=np.int64),
+        "moves": np.array([move.gate for move in state.current_moves], dtype=str),
+        "block_qubits": np.array([q for block in blocks for q in block.qubits], dtype=np.int64),
+        "block_ptr": np.cumsum([0] + [len(block) for block in blocks], dtype=np.int64),
+        "amplitudes": np.concatenate([block.tensor.reshape(-1) for block in blocks] + [np.zeros(0, dtype=complex)]),
+        "tableau_qubits": np.array([q for block in tableaux for q in block.qubits], dtype=np.int64),
+        "tableau_ptr": np.cumsum([0] + [len(block) for block in tableaux], dtype=np.int64),
+        "tableau_x": np.concatenate([block.x.reshape(-1) for block in tableaux] + [np.zeros(0, dtype=bool)]),
+        "tableau_z": np.concatenate([block.z.reshape(-1) for block in tableaux] + [np.zeros(0, dtype=bool)]),
+        "tableau_r": np.concatenate([block.r for block in tableaux] + [np.zeros(0, dtype=np.int64)]),
+        "pending_qubits": np.array(list(circuit.pending.keys()), dtype=np.int64),
+        "pending": np.array(list(circuit.pending.values()), dtype=complex).reshape(-1, 2, 2),
+        "rng": np.array(json.dumps(circuit.state.rng.bit_generator.state)),
+    }
+
+    temporary = f"{filename}.{os.getpid()}.tmp"
+    with open(temporary, "wb") as f:
+        (np.savez_compressed if compress else np.savez)(f, **arrays)
+    os.replace(temporary, filename)
+    return filename
+
+
+# Restore a snapshot on the world it was taken on, returns the GameState.
+# The block tensors are views on the loaded amplitude array, they are never copied.
+def load_snapshot(filename, world):
+    with np.load(filename, allow_pickle=False) as data:
+        arrays = {name: data[name] for name in data.files}
+    version, player, phase, turn = arrays["game"].tolist()
+    if version != SNAPSHOT_VERSION:
+        raise ValueError(f"{filename}: unsupported snapshot version {version}")
+    names = [country.name for country in world.get_all_countries()]
+    if arrays["countries"].tolist() != names:
+        raise ValueError(f"{filename}: snapshot of another map")
+
+    for name, owner in zip(names, arrays["owners"].tolist()):
+        world.set_owner(name, owner)
+
+    circuit = GameCircuit(world.get_qubit_amount())
+    qubits, pointers, amplitudes = arrays["block_qubits"].tolist(), arrays["block_ptr"].tolist(), arrays["amplitudes"]
+    blocks = []
+    offset = 0
+    for start, end in zip(pointers, pointers[1:]):
+        size = 2 ** (end - start)
+        blocks.append(Block(qubits[start:end], amplitudes[offset:offset + size].reshape((2,) * (end - start))))
+        offset += size
+    qubits, pointers = arrays["tableau_qubits"].tolist(), arrays["tableau_ptr"].tolist()
+    offset = 0
+    for start, end in zip(pointers, pointers[1:]):
+        n = end - start
+        x = arrays["tableau_x"][offset:offset + n * n].reshape(n, n)
+        z = arrays["tableau_z"][offset:offset + n * n].reshape(n, n)
+        blocks.append(StabilizerBlock(qubits[start:end], x, z, arrays["tableau_r"][start:end]))
+        offset += n * n
+    circuit.state.set_blocks(blocks)
+    arrays["pending"].setflags(write=False)
+    circuit.pending = dict(zip(arrays["pending_qubits"].tolist(), arrays["pending"]))
+    circuit.state.rng.bit_generator.state = json.loads(arrays["rng"].item())
+
+    state = GameState(world, circuit)
+    state.current_player = player
+    state.phase = phase
+    state.turn = turn
+    state.current_moves = [PlacingMove(gate) for gate in arrays["moves"].tolist()]
+    return state
@@ -0,0 +1,290 @@
+from functools import lru_cache
+import numpy as np
+
+# Stabilizer tableau simulation of Clifford circuits.
+#
+# A Pauli operator on n qubits is stored as (r, x, z): i^r X^x Z^z, where x and z are bit
+# vectors over the qubits and X^x Z^z is the product of X^x[q] Z^z[q] over the qubits q.
+# Products follow (r1, x1, z1)(r2, x2, z2) = (r1 + r2 + 2 z1.x2, x1 ^ x2, z1 ^ z2).
+# A stabilizer state of n qubits is stored as n independent commuting generators.
+
+PAULI_X_MATRIX = np.array([[0, 1], [1, 0]], dtype=complex)
+PAULI_Z_MATRIX = np.array([[1, 0], [0, -1]], dtype=complex)
+
+# Tolerance used to recognize Pauli operators and stabilizer states from dense matrices
+PAULI_TOLERANCE = 1e-9
+
+
+# Matrix of the Pauli i^r X^x Z^z, the first qubit being the most significant bit
+def pauli_matrix(r, x, z):
+    matrix = np.ones((1, 1), dtype=complex)
+    for xq, zq in zip(x, z):
+        local = np.eye(2, dtype=complex)
+        if zq:
+            local = PAULI_Z_MATRIX
+        if xq:
+            local = PAULI_X_MATRIX @ local
+        matrix = np.kron(matrix, local)
+    return (1j ** r) * matrix
+
+
+def pauli_product(p1, p2):
+    r1, x1, z1 = p1
+    r2, x2, z2 = p2
+    return (r1 + r2 + 2 * int(np.sum(z1 & x2))) % 4, x1 ^ x2, z1 ^ z2
+
+
+# (r, x, z) of a matrix equal to a Pauli operator up to i^r, None for any other matrix
+def decompose_pauli(matrix, k):
+    dimension = 2 ** k
+    for index in range(4 ** k):
+        x = np.array([(index >> (2 * k - 1 - j)) & 1 for j in range(k)], dtype=bool)
+        z = np.array([(index >> (k - 1 - j)) & 1 for j in range(k)], dtype=bool)
+        coefficient = np.trace(pauli_matrix(0, x, z).conj().T @ matrix) / dimension
+        if abs(abs(coefficient) - 1) < PAULI_TOLERANCE:
+            r = int(round(np.angle(coefficient) / (np.pi / 2))) % 4
+            if abs(coefficient - 1j ** r) < PAULI_TOLERANCE:
+                return r, x, z
+            return None
+    return None
+
+
+# Tableau update of a k-qubit unitary, or None if it is not a Clifford (up to a global phase).
+# The update gives, for each local Pauli X^x Z^z on the k qubits (indexed by the bits of x
+# then z, first qubit first), its image U X^x Z^z U^dagger as arrays (r, x, z).
+# Cached by matrix, the game only emits a small set of distinct unitaries.
+def clifford_table(matrix):
+    matrix = np.asarray(matrix, dtype=complex)
+    return _clifford_table(matrix.shape[0], matrix.tobytes())
+
+
+@lru_cache(maxsize=4096)
+def _clifford_table(dimension, data):
+    matrix = np.frombuffer(data, dtype=complex).reshape(dimension, dimension)
+    k = dimension.bit_length() - 1
+    images = []
+    for qubit in range(k):
+        for generator in ("X", "Z"):
+            x = np.zeros(k, dtype=bool)
+            z = np.zeros(k, dtype=bool)
+            (x if generator == "X" else z)[qubit] = True
+            image = decompose_pauli(matrix @ pauli_matrix(0, x, z) @ matrix.conj().T, k)
+            if image is None:
+                return None
+            images.append(image)
+
+    table_r = np.zeros(4 ** k, dtype=np.int64)
+    table_x = np.zeros((4 ** k, k), dtype=bool)
+    table_z = np.zeros((4 ** k, k), dtype=bool)
+    for index in range(4 ** k):
+        product = (0, np.zeros(k, dtype=bool), np.zeros(k, dtype=bool))
+        for qubit in range(k):
+            if (index >> (2 * k - 1 - qubit)) & 1:
+                product = pauli_product(product, images[2 * qubit])
+            if (index >> (k - 1 - qubit)) & 1:
+                product = pauli_product(product, images[2 * qubit + 1])
+        table_r[index], table_x[index], table_z[index] = product
+    return table_r, table_x, table_z
+
+
+# Multiply (on the right) the rows of the mask by the row pivot, in place
+def multiply_rows(bits, r, mask, pivot, n):
+    r[mask] = (r[mask] + r[pivot] + 2 * np.sum(bits[mask, n:] & bits[pivot, :n], axis=1)) % 4
+    bits[mask] ^= bits[pivot]
+
+
+# Group of qubits in a stabilizer state, stored as a tableau of n generators.
+# Row i of x, z and r is generator i, column j of x and z corresponds to qubits[j].
+# The columns are stored separately, so a gate only replaces the columns of its qubits.
+# Like Block, a StabilizerBlock is never modified: every operation returns new arrays.
+class StabilizerBlock:
+    def __init__(self, qubits, x, z, r):
+        self.qubits = tuple(qubits)
+        self.x_columns = tuple(x.T)
+        self.z_columns = tuple(z.T)
+        self.r = r
+
+    @property
+    def x(self):
+        return np.stack(self.x_columns, axis=1)
+
+    @property
+    def z(self):
+        return np.stack(self.z_columns, axis=1)
+
+    @property
+    def nbytes(self):
+        return sum(column.nbytes for column in self.x_columns + self.z_columns) + self.r.nbytes
+
+    def axis(self, qubit):
+        return self.qubits.index(qubit)
+
+    def __len__(self):
+        return len(self.qubits)
+
+    def with_qubits(self, qubits):
+        block = StabilizerBlock.__new__(StabilizerBlock)
+        block.qubits = tuple(qubits)
+        block.x_columns, block.z_columns, block.r = self.x_columns, self.z_columns, self.r
+        return block
+
+    # Tableau of a single qubit state, None if it is not a stabilizer state
+    @staticmethod
+    def from_vector(qubit, vector):
+        a, b = vector
+        bloch = (2 * (a.conjugate() * b).real, 2 * (a.conjugate() * b).imag, abs(a) ** 2 - abs(b) ** 2)
+        for axis, (x, z, r) in enumerate([(True, False, 0), (True, True, 1), (False, True, 0)]):
+            if abs(abs(bloch[axis]) - 1) < PAULI_TOLERANCE:
+                r = (r + (2 if bloch[axis] < 0 else 0)) % 4
+                return StabilizerBlock([qubit], np.array([[x]]), np.array([[z]]), np.array([r]))
+        return None
+
+    # Tableau of the product state of two blocks
+    @staticmethod
+    def merge(block1, block2):
+        n1, n2 = len(block1), len(block2)
+        x = np.zeros((n1 + n2, n1 + n2), dtype=bool)
+        z = np.zeros((n1 + n2, n1 + n2), dtype=bool)
+        x[:n1, :n1], x[n1:, n1:] = block1.x, block2.x
+        z[:n1, :n1], z[n1:, n1:] = block1.z, block2.z
+        return StabilizerBlock(block1.qubits + block2.qubits, x, z, np.concatenate([block1.r, block2.r]))
+
+    # Conjugate every generator by a Clifford given by its clifford_table, acting on the axes
+    def apply(self, table, axes):
+        table_r, table_x, table_z = table
+        k = len(axes)
+        index = np.zeros(len(self.r), dtype=np.int64)
+        for j, axis in enumerate(axes):
+            index |= self.x_columns[axis].astype(np.int64) << (2 * k - 1 - j)
+            index |= self.z_columns[axis].astype(np.int64) << (k - 1 - j)
+        x_columns, z_columns = list(self.x_columns), list(self.z_columns)
+        new_x, new_z = table_x[index], table_z[index]
+        for j, axis in enumerate(axes):
+            x_columns[axis] = new_x[:, j]
+            z_columns[axis] = new_z[:, j]
+        block = self.with_qubits(self.qubits)
+        block.x_columns, block.z_columns = tuple(x_columns), tuple(z_columns)
+        block.r = (self.r + table_r[index]) % 4
+        return block
+
+    # Gauss-Jordan elimination of the generators on the given columns of [x | z].
+    # Returns (bits, r, pivots): the reduced generators, which generate the same group, and
+    # the pivot column of each of the first len(pivots) rows. The other rows are zero on the
+    # given columns.
+    def reduce(self, columns):
+        n = len(self)
+        bits = np.concatenate([self.x, self.z], axis=1)
+        r = self.r.copy()
+        pivots = []
+        for column in columns:
+            row = len(pivots)
+            if row == n:
+                break
+            candidates = np.nonzero(bits[row:, column])[0]
+            if len(candidates) == 0:
+                continue
+            pivot = row + candidates[0]
+            if pivot != row:
+                bits[[row, pivot]] = bits[[pivot, row]]
+                r[[row, pivot]] = r[[pivot, row]]
+            mask = bits[:, column].copy()
+            mask[row] = False
+            if mask.any():
+                multiply_rows(bits, r, mask, row, n)
+            pivots.append(column)
+        return bits, r, pivots
+
+    # Measure a qubit in the Z basis: returns the outcome (0 or 1) and the block of the other
+    # qubits, the measured qubit being left in a product state
+    def measure(self, qubit, rng):
+        n = len(self)
+        a = self.axis(qubit)
+        rows = np.nonzero(self.x_columns[a])[0]
+        if len(rows) > 0:
+            # Random outcome: only the first anticommuting generator is replaced by +-Z
+            bits = np.concatenate([self.x, self.z], axis=1)
+            r = self.r.copy()
+            pivot = rows[0]
+            mask = bits[:, a].copy()
+            mask[pivot] = False
+            if mask.any():
+                multiply_rows(bits, r, mask, pivot, n)
+            outcome = int(rng.random() < 0.5)
+            bits[pivot] = False
+            bits[pivot, n + a] = True
+            r[pivot] = 2 * outcome
+        else:
+            # Deterministic outcome: +-Z is in the group, it is the only row left unreduced
+            bits, r, pivots = self.reduce([c for c in range(2 * n) if c != n + a])
+            pivot = len(pivots)
+            outcome = int(r[pivot]) // 2
+
+        # The other generators are cleared on the measured qubit, which is removed
+        mask = bits[:, n + a].copy()
+        mask[pivot] = False
+        if mask.any():
+            multiply_rows(bits, r, mask, pivot, n)
+        keep_rows = np.arange(n) != pivot
+        keep_columns = np.arange(n) != a
+        rest = StabilizerBlock(self.qubits[:a] + self.qubits[a + 1:], bits[keep_rows][:, :n][:, keep_columns],
+                               bits[keep_rows][:, n:][:, keep_columns], r[keep_rows])
+        return outcome, rest
+
+    # Exact <X>, <Y>, <Z> of every qubit, as an array of shape (n, 3).
+    # A Pauli of one qubit has a non zero expectation only if it commutes with every generator,
+    # its sign is read from the product of generators giving it.
+    def bloch_vectors(self):
+        n = len(self)
+        bloch = np.zeros((n, 3))
+        x, z = self.x, self.z
+        pure = [~z.any(axis=0), ~(x ^ z).any(axis=0), ~x.any(axis=0)]
+        if not any(p.any() for p in pure):
+            return bloch
+        bits, r, pivots = self.reduce(range(2 * n))
+        rows = {column: row for row, column in enumerate(pivots)}
+        for axis, (has_x, has_z, phase) in enumerate([(True, False, 0), (True, True, 1), (False, True, 0)]):
+            for q in np.nonzero(pure[axis])[0]:
+                target = np.zeros(2 * n, dtype=bool)
+                target[q], target[n + q] = has_x, has_z
+                product = (0, np.zeros(n, dtype=bool), np.zeros(n, dtype=bool))
+                for column in np.nonzero(target)[0]:
+                    if column in rows:      # In reduced form, only the pivots of the target contribute
+                        row = rows[column]
+                        product = pauli_product(product, (r[row], bits[row, :n], bits[row, n:]))
+                bloch[q, axis] = 1.0 if (product[0] - phase) % 4 == 0 else -1.0
+        return bloch
+
+    # Reduced density matrix of the given qubits, first qubit as the most significant bit.
+    # It is the average of the group elements supported on these qubits only.
+    def reduced_density_matrix(self, qubits):
+        n = len(self)
+        axes = [self.axis(q) for q in qubits]
+        others = [a for a in range(n) if a not in axes]
+        bits, r, pivots = self.reduce(others + [n + a for a in others])
+        local = range(len(pivots), n)
+
+        rho = np.zeros((2 ** len(axes), 2 ** len(axes)), dtype=complex)
+        for subset in range(2 ** len(local)):
+            product = (0, np.zeros(n, dtype=bool), np.zeros(n, dtype=bool))
+            for j, row in enumerate(local):
+                if (subset >> j) & 1:
+                    product = pauli_product(product, (r[row], bits[row, :n], bits[row, n:]))
+            rho += pauli_matrix(product[0], product[1][axes], product[2][axes])
+        return rho / 2 ** len(axes)
+
+    # Dense state tensor of the block (exponential in its size), axis i being qubits[i].
+    # Projects a fixed generic vector on the +1 eigenspace of every generator.
+    def to_tensor(self):
+        n = len(self)
+        rng = np.random.default_rng(0)
+        tensor = rng.normal(size=(2,) * n) + 1j * rng.normal(size=(2,) * n)
+        for r, x, z in zip(self.r, self.x, self.z):
+            image = tensor
+            for axis in np.nonzero(z)[0]:
+                shape = [1] * n
+                shape[axis] = 2
+                image = image * np.array([1, -1]).reshape(shape)
+            for axis in np.nonzero(x)[0]:
+                image = np.flip(image, axis)
+            tensor = (tensor + (1j ** r) * image) / 2
+        return tensor / np.linalg.norm(tensor)
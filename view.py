@@ -0,0 +1,211 @@
+from tkinter import *
+from assets import load_scaled_image
+from graph import COLORS
+
+
+# Tkinter view of a World: owns the window, the canvas and the country selection.
+# The game rules never depend on it, see engine.GameState.
+#
+# The scene is retained: every continent, edge and country gets its canvas items once,
+# later renders only update the attributes which changed (owner color, selection size,
+# troop strength) with itemconfig/coords. Clicks are dispatched from a single binding.
+class WorldView:
+	def __init__(self, world, size=1200):
+		self.world = world
+		self.size = size
+		self.root = Tk()					# The tkinter root object
+		self.root.title("Quantum Risk")
+		self.canvas = Canvas(self.root, width=size, height=int(size*0.75)) # The canvas
+		self.canvas.pack()
+		self.selection = ""					# The name of the selected country
+		self.can_select = False
+		self.selection_player = 0
+		self.troop_strength = {}			# Expected troop strength of each country, shown on the map
+		self.on_select = None				# Called with the name of each newly selected country
+		self.on_hover = None				# Called with the name of the country under the mouse, or None
+
+		self.background = load_scaled_image("background.png", size, int(size * 0.75))	# The background
+
+		self.country_items = {}				# Country name -> (oval, strength text)
+		self.drawn = {}						# Country name -> (owner, selected, strength) on the canvas
+		self.click_callbacks = {}			# Canvas item -> callback run when the item is clicked
+		self.item_countries = {}			# Canvas item -> name of the country it belongs to
+		self.highlighted = set()			# Names of the countries drawn with a highlighted outline
+		self.message_timer = None
+		self.build()
+
+	# Create every canvas item of the scene, done once
+	def build(self):
+		self.canvas.create_image(0, 0, anchor="nw", image=self.background, tags="background")
+		font = ("Helvetica", 13, "bold")
+		for continent in self.world.continents.values():
+			x, y = continent.x * self.size, continent.y * self.size
+			self.canvas.create_text(x, y, fill=continent.color, text=f"{continent.name} ({continent.gate})", font=font)
+		for edge in self.world.country_graph.edges():
+			self.create_edge(*edge)
+		for country in self.world.get_all_countries():
+			x, y = country.get_pos(self.size)
+			oval = self.canvas.create_oval(x - 20, y - 20, x + 20, y + 20, fill=COLORS[country.owner], tags="country")
+			strength = self.canvas.create_text(x, y, text="", font=("Helvetica", 9, "bold"), fill="white", tags="country")
+			self.country_items[country.name] = (oval, strength)
+			for item in (oval, strength):
+				self.item_countries[item] = country.name
+				self.bind_click(item, lambda name=country.name: self.select(name))
+		self.title = self.canvas.create_text(0, 0, text="", font=("Helvetica", 10), state="hidden")
+		self.turn_text = self.canvas.create_text(self.size // 2, 20, text="", font=("Helvetica", 20))
+
+		# Marker and arrow pointing at the countries selected for a move
+		self.marker = self.canvas.create_oval(0, 0, 0, 0, fill="green", state="hidden")
+		self.arrow = self.canvas.create_line(0, 0, 0, 0, width=5, arrowshape=(20, 20, 10), state="hidden")
+
+		self.message_box = self.canvas.create_rectangle(0, self.size*3//8 - 20, self.size, self.size*3//8 + 20, fill="white", state="hidden")
+		self.message = self.canvas.create_text(self.size//2, self.size*3//8, text="", font=("Helvetica", 20), state="hidden")
+		self.tooltip = self.canvas.create_text(0, 0, text="", font=("Helvetica", 11, "bold"), fill="white", state="hidden")
+		self.tooltip_box = self.canvas.create_rectangle(0, 0, 0, 0, fill="black", state="hidden")
+		self.canvas.tag_bind("clickable", "<Button-1>", self.on_click)
+		self.canvas.tag_bind("country", "<Enter>", self.on_enter)
+		self.canvas.tag_bind("country", "<Leave>", self.on_leave)
+
+	def create_edge(self, a, b):
+		country1 = self.world.get_country(a)
+		country2 = self.world.get_country(b)
+		x1, y1 = country1.x * self.size, country1.y * self.size
+		x2, y2 = country2.x * self.size, country2.y * self.size
+		if abs(x1 - x2) > self.size / 2:
+			self.canvas.create_line(x1, y1, 0, y1, fill="black", width=2)
+			self.canvas.create_line(self.size, y1, x2, y2, fill="black", width=2)
+		else:
+			self.canvas.create_line(x1, y1, x2, y2, fill="black", width=2)
+
+	def bind_click(self, item, callback):
+		self.click_callbacks[item] = callback
+		self.canvas.addtag_withtag("clickable", item)
+
+	def delete_item(self, item):
+		self.click_callbacks.pop(item, None)
+		self.canvas.delete(item)
+
+	def on_click(self, event):
+		for item in self.canvas.find_withtag("current"):
+			if item in self.click_callbacks:
+				self.click_callbacks[item]()
+				return
+
+	def on_enter(self, event):
+		for item in self.canvas.find_withtag("current"):
+			if item in self.item_countries and self.on_hover is not None:
+				self.on_hover(self.item_countries[item])
+				return
+
+	def on_leave(self, event):
+		if self.on_hover is not None:
+			self.on_hover(None)
+
+	# Update the items of the given countries (by default all) whose state changed
+	def render(self, countries=None):
+		if countries is None:
+			countries = self.country_items.keys()
+		for name in countries:
+			country = self.world.get_country(name)
+			selected = name == self.selection
+			strength = self.troop_strength.get(name)
+			state = (country.owner, selected, strength)
+			if self.drawn.get(name) == state:
+				continue
+			previous = self.drawn.get(name, (None, None, None))
+			self.drawn[name] = state
+
+			oval, text = self.country_items[name]
+			x, y = country.get_pos(self.size)
+			if previous[0] != country.owner:
+				self.canvas.itemconfig(oval, fill=COLORS[country.owner])
+			if previous[1] != selected:
+				size = 30 if selected else 20
+				self.canvas.coords(oval, x - size, y - size, x + size, y + size)
+				if selected:
+					self.canvas.coords(self.title, x, y - size - 10)
+					self.canvas.itemconfig(self.title, text=name, state="normal")
+				elif self.canvas.itemcget(self.title, "text") == name:
+					self.canvas.itemconfig(self.title, state="hidden")
+			if previous[2] != strength:
+				self.canvas.itemconfig(text, text="" if strength is None else f"{strength:+.2f}")
+
+	# Outline the given countries, e.g. the ones reachable for a troop swap
+	def highlight(self, countries):
+		countries = set(countries)
+		for name in self.highlighted - countries:
+			self.canvas.itemconfig(self.country_items[name][0], outline="black", width=1)
+		for name in countries - self.highlighted:
+			self.canvas.itemconfig(self.country_items[name][0], outline="green", width=4)
+		self.highlighted = countries
+
+	def set_turn_text(self, text, color):
+		self.canvas.itemconfig(self.turn_text, text=text, fill=color)
+
+	# Show the marker on a country, or an arrow from a country to another one
+	def show_pointer(self, country1, country2=None, color="green", arrow="last"):
+		x1, y1 = country1.get_pos(self.size)
+		if country2 is None:
+			self.canvas.coords(self.marker, x1 - 5, y1 - 5, x1 + 5, y1 + 5)
+			self.canvas.itemconfig(self.marker, state="normal")
+			self.canvas.itemconfig(self.arrow, state="hidden")
+		else:
+			x2, y2 = country2.get_pos(self.size)
+			self.canvas.coords(self.arrow, x2, y2, x1, y1)
+			self.canvas.itemconfig(self.arrow, fill=color, arrow=arrow, state="normal")
+			self.canvas.itemconfig(self.marker, state="hidden")
+		self.canvas.tag_raise(self.arrow)
+		self.canvas.tag_raise(self.marker)
+
+	# Small text box under a country, e.g. the odds of an attack on it
+	def show_tooltip(self, country, text):
+		x, y = country.get_pos(self.size)
+		self.canvas.coords(self.tooltip, x, y + 40)
+		self.canvas.itemconfig(self.tooltip, text=text, state="normal")
+		self.canvas.coords(self.tooltip_box, x - 4 * len(text) - 6, y + 30, x + 4 * len(text) + 6, y + 50)
+		self.canvas.itemconfig(self.tooltip_box, state="normal")
+		self.canvas.tag_raise(self.tooltip_box)
+		self.canvas.tag_raise(self.tooltip)
+
+	def hide_tooltip(self):
+		self.canvas.itemconfig(self.tooltip, state="hidden")
+		self.canvas.itemconfig(self.tooltip_box, state="hidden")
+
+	def hide_pointer(self):
+		self.canvas.itemconfig(self.marker, state="hidden")
+		self.canvas.itemconfig(self.arrow, state="hidden")
+
+	def select(self, country):
+		if not self.can_select:
+			return
+		if self.world.get_country(country).is_owned(self.selection_player) or self.selection_player == 0:
+			previous = self.selection
+			self.selection = country
+			self.render([c for c in (previous, country) if c != ""])
+			if self.on_select is not None:
+				self.on_select(country)
+
+	def get_selected_country(self):
+		if self.selection == "":
+			return None
+		return self.world.get_country(self.selection)
+
+	def allow_selection(self, can_select, player=0, select_enemy=False):
+		self.can_select = can_select
+		self.selection_player = player if not select_enemy else (player % 2) + 1
+		if not can_select:
+			self.selection = ""
+
+	def show_temporary_message(self, text, color, time):
+		self.canvas.itemconfig(self.message, text=text, fill=color, state="normal")
+		self.canvas.itemconfig(self.message_box, state="normal")
+		self.canvas.tag_raise(self.message_box)
+		self.canvas.tag_raise(self.message)
+		if self.message_timer is not None:
+			self.root.after_cancel(self.message_timer)
+		self.message_timer = self.root.after(time, self.hide_temporary_message)
+
+	def hide_temporary_message(self):
+		self.message_timer = None
+		self.canvas.itemconfig(self.message, state="hidden")
+		self.canvas.itemconfig(self.message_box, state="hidden")